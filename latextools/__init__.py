@@ -5,6 +5,11 @@ from .project import (
 
 from .pdf import Pdf
 
+from .cache import RenderCache
+from .format_cache import FormatCache
+from .pool import PdflatexPool
+from .inkscape_pool import InkscapePool, set_inkscape_pool
+
 from .file import (
     FileAbc,
     BinaryFile,
@@ -36,8 +41,17 @@ from .convert import (
     render_latex_in_svg,
     svg_to_png,
     text_to_svg,
+    pdf_to_svg_async,
+    pdfs_to_svgs,
+    pdf_to_png,
+    pdfs_to_pngs,
+    Png,
+    split_pdf_pages,
+    GlyphRegistry,
 )
 
+from .async_util import set_async_concurrency
+
 from .common_preamble import (
     pkg,
     cmd,
@@ -49,6 +63,9 @@ from .common_preamble import (
 
 from .shortcuts import (
     render_snippet,
+    render_snippet_async,
+    render_snippets,
+    LatexSnippetError,
     render_qcircuit,
     render_svg,
 )
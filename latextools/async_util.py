@@ -0,0 +1,80 @@
+import asyncio
+import weakref
+
+
+_max_concurrency = 8
+_semaphores = weakref.WeakKeyDictionary()  # Event loop -> semaphore
+
+
+def set_async_concurrency(max_concurrency):
+    '''
+    Sets the maximum number of child processes started concurrently by the
+    async rendering functions of each event loop.
+    '''
+    global _max_concurrency
+    _max_concurrency = max_concurrency
+    _semaphores.clear()
+
+def get_semaphore():
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(_max_concurrency)
+        _semaphores[loop] = semaphore
+    return semaphore
+
+async def gather_or_cancel(*aws):
+    '''
+    Like asyncio.gather but if one awaitable raises, the others are
+    cancelled and awaited before the exception propagates.
+    '''
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # Wait so no child process outlives the caller's cleanup
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+async def run_process(args, cwd, not_found_msg, error_type,
+                      semaphore=None, env=None):
+    '''
+    Runs a command without blocking the event loop and returns its stdout.
+
+    The child process is killed if the calling task is cancelled.
+
+    Args:
+        semaphore: Limits concurrent processes.  Defaults to a shared
+            semaphore for the running event loop.
+        env: Optional environment variables for the process.
+    '''
+    if semaphore is None:
+        semaphore = get_semaphore()
+    async with semaphore:
+        try:
+            p = await asyncio.create_subprocess_exec(
+                    *args,
+                    cwd=cwd,
+                    env=env,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE)
+        except FileNotFoundError:
+            raise error_type(not_found_msg)
+        try:
+            stdout, stderr = await p.communicate()
+        except asyncio.CancelledError:
+            if p.returncode is None:
+                p.kill()
+            await asyncio.shield(p.wait())
+            raise
+    if p.returncode != 0:
+        # The command had an error
+        msg = ''
+        if stdout:
+            msg += stdout.decode()
+        if stderr:
+            msg += stderr.decode()
+        raise error_type(msg)
+    return stdout
@@ -0,0 +1,207 @@
+import functools
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+
+class RenderCache:
+    # Temporary directories older than this many seconds are left over from
+    # a crash
+    STALE_TMP_AGE = 3600
+
+    def __init__(self, cache_dir, max_size=256*2**20):
+        '''
+        A content-addressed on-disk cache of compiled outputs.
+
+        Entries are directories of named files stored under a hex digest key.
+        Entries are written to a temporary directory and renamed into place
+        so several processes may safely share the same cache directory.  Once
+        the total size exceeds max_size, the least recently used entries are
+        evicted.  The total is a running estimate, refreshed by scanning the
+        cache only when eviction runs, so storing an entry does not scan the
+        whole cache.
+
+        Args:
+            cache_dir: The directory to store entries in.  It is created if
+                it does not exist.
+            max_size: The maximum total size of all entries in bytes or None
+                for no limit.
+        '''
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_size = max_size
+        self._size_estimate = None  # Total bytes as of the last scan + puts
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        '''
+        Returns a hex digest of the given str, bytes, or None parts.
+        '''
+        h = hashlib.sha256()
+        for part in parts:
+            if part is None:
+                part = b'\xff'
+            elif isinstance(part, str):
+                part = part.encode()
+            h.update(len(part).to_bytes(8, 'little'))
+            h.update(part)
+        return h.hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key):
+        '''
+        Returns a dict mapping file names to bytes or None on a cache miss.
+        '''
+        entry_dir = self._entry_dir(key)
+        try:
+            files = {}
+            for name in os.listdir(entry_dir):
+                with open(os.path.join(entry_dir, name), 'rb') as f:
+                    files[name] = f.read()
+            # Mark as recently used
+            os.utime(entry_dir)
+        except (FileNotFoundError, NotADirectoryError):
+            # Missing or evicted by another process while reading
+            return None
+        return files
+
+    def put(self, key, files):
+        '''
+        Stores a dict mapping file names to bytes under key.
+        '''
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir):
+            return
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            for name, data in files.items():
+                with open(os.path.join(tmp_dir, name), 'wb') as f:
+                    f.write(data)
+            try:
+                os.rename(tmp_dir, entry_dir)
+            except OSError:
+                # Another process stored the same entry first
+                pass
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        if self.max_size is not None:
+            if self._size_estimate is None:
+                self._size_estimate = sum(
+                        size for _, size, _ in self._list_entries())
+            else:
+                self._size_estimate += sum(map(len, files.values()))
+            if self._size_estimate > self.max_size:
+                # Leave some room so the next puts do not evict again
+                self.evict(self.max_size * 9 // 10)
+
+    def _list_entries(self):
+        for sub in os.scandir(self.cache_dir):
+            if not sub.is_dir() or sub.name.startswith('.'):
+                continue
+            for entry in os.scandir(sub.path):
+                try:
+                    mtime = entry.stat().st_mtime
+                    size = sum(f.stat().st_size
+                               for f in os.scandir(entry.path))
+                except FileNotFoundError:
+                    continue
+                yield mtime, size, entry.path
+
+    def evict(self, max_size=0):
+        '''
+        Removes least recently used entries until at most max_size bytes
+        remain.
+
+        Temporary directories left behind by a crashed process are also
+        removed.
+        '''
+        with _FileLock(os.path.join(self.cache_dir, '.lock')):
+            self._remove_stale_tmp()
+            entries = sorted(self._list_entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if total <= max_size:
+                    break
+                # Rename first so a concurrent get never sees a partially
+                # removed entry
+                tmp_path = os.path.join(self.cache_dir,
+                                        f'.tmp-{os.path.basename(path)}')
+                try:
+                    os.rename(path, tmp_path)
+                except OSError:
+                    continue
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                total -= size
+            self._size_estimate = total
+
+    def _remove_stale_tmp(self):
+        now = time.time()
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.startswith('.tmp-'):
+                continue
+            try:
+                if now - entry.stat().st_mtime < self.STALE_TMP_AGE:
+                    continue
+            except FileNotFoundError:
+                continue
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    def clear(self):
+        self.evict(0)
+
+
+class _FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.f = open(self.path, 'a')
+            fcntl.flock(self.f, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.f is not None:
+            fcntl.flock(self.f, fcntl.LOCK_UN)
+            self.f.close()
+            self.f = None
+
+
+@functools.lru_cache(maxsize=None)
+def pdflatex_version(command='pdflatex'):
+    '''
+    Returns the first line of `pdflatex --version` or None if not installed.
+    '''
+    try:
+        out = subprocess.run([command, '--version'], stdout=subprocess.PIPE,
+                             stderr=subprocess.DEVNULL).stdout
+    except FileNotFoundError:
+        return None
+    return out.decode(errors='replace').split('\n', 1)[0]
+
+
+def fs_digest(src_fs, chunk_size=2**16):
+    '''
+    Returns a digest of every file path and its contents in a pyfilesystem.
+    '''
+    h = hashlib.sha256()
+    for path in sorted(src_fs.walk.files()):
+        file_h = hashlib.sha256()
+        with src_fs.open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                file_h.update(chunk)
+        h.update(path.encode() + b'\0' + file_h.digest())
+    return h.hexdigest()
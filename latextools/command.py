@@ -5,15 +5,36 @@ from . import content
 
 @functools.total_ordering
 class LatexCommand:
+    _FIELDS = ('name', 'setup_content', 'sort_priority', 'packages',
+               'commands')
+    __slots__ = (*_FIELDS, '_frozen', '_key_cache', '_sort_key_cache',
+                 '_hash', '_depth', '__weakref__')
+
     def __init__(self, name, setup_content, sort_priority=0,
                  packages=(), commands=()):
+        '''
+        A command or other definition in a document preamble.
+
+        Commands are immutable so their key, hash, sort key, and depth are
+        computed at most once.
+        '''
         self.name = name
         if isinstance(setup_content, str):
             setup_content = content.BasicContent(setup_content)
         self.setup_content = setup_content
         self.sort_priority = sort_priority
-        self.packages = list(packages)
-        self.commands = list(commands)
+        self.packages = tuple(packages)
+        self.commands = tuple(commands)
+        self._key_cache = None
+        self._sort_key_cache = None
+        self._hash = None
+        self._depth = None
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if name in LatexCommand._FIELDS and getattr(self, '_frozen', False):
+            raise AttributeError(f'LatexCommand is immutable: {name}')
+        super().__setattr__(name, value)
 
     def latex_code_setup(self):
         if self.setup_content is None:
@@ -32,25 +53,28 @@ class LatexCommand:
             yield from self.setup_content.required_commands()
 
     def require_depth(self):
-        try:
-            next(iter(self.required_commands()))
-        except StopIteration:
-            return 0
-        return 1+max(map(LatexCommand.require_depth, self.required_commands()))
+        if self._depth is None:
+            self._depth = 1 + max(map(LatexCommand.require_depth,
+                                      self.required_commands()),
+                                  default=-1)
+        return self._depth
 
     def _key(self):
-        if self.setup_content is None:
-            content = ''
-        else:
-            content = self.setup_content.latex_code_body()
-        return (-self.sort_priority, self.name, content)
+        if self._key_cache is None:
+            if self.setup_content is None:
+                content = ''
+            else:
+                content = self.setup_content.latex_code_body()
+            self._key_cache = (-self.sort_priority, self.name, content)
+        return self._key_cache
 
     def _sort_key(self):
-        if self.setup_content is None:
-            content = ''
-        else:
-            content = self.setup_content.latex_code_body()
-        return (-self.sort_priority, self.require_depth(), self.name, content)
+        if self._sort_key_cache is None:
+            key = self._key()
+            # Bundles have no name
+            self._sort_key_cache = (key[0], self.require_depth(),
+                                    key[1] or '', key[2])
+        return self._sort_key_cache
 
     def __lt__(self, other):
         if not isinstance(other, LatexCommand):
@@ -61,11 +85,15 @@ class LatexCommand:
     def __eq__(self, other):
         if not isinstance(other, LatexCommand):
             return NotImplemented
+        elif self is other:
+            return True
         else:
-            return self._key() == other._key()
+            return hash(self) == hash(other) and self._key() == other._key()
 
     def __hash__(self):
-        return hash((LatexCommand, self._key()))
+        if self._hash is None:
+            self._hash = hash((LatexCommand, self._key()))
+        return self._hash
 
     def can_coexist(self, other):
         return self.name != other.name or not self.name
@@ -80,5 +108,7 @@ class LatexCommand:
 
 
 class CommandBundle(LatexCommand):
+    __slots__ = ()
+
     def __init__(self, *commands, packages=()):
         super().__init__(None, None, packages=packages, commands=commands)
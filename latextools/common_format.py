@@ -17,5 +17,12 @@ class WrapContent(LatexContentAbc):
         body = self.content.latex_code_body(indent=indent)
         return '\n'.join([pre, body, post])
 
+    def _write_latex_code_body(self, w, indent=''):
+        w.write(str_util.prefix_lines(indent, self.pre_code))
+        w.write('\n')
+        self.content.write_latex_code_body(w, indent=indent)
+        w.write('\n')
+        w.write(str_util.prefix_lines(indent, self.post_code))
+
 def centering_content(content):
     return WrapContent('\centering', '', content)
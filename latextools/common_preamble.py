@@ -15,7 +15,12 @@ from .document import (
 
 class pkg:
     def __getattr__(self, key):
-        return LatexPackage(key)
+        if key.startswith('_'):
+            raise AttributeError(key)
+        # Only called for missing names so each package is created once
+        package = LatexPackage(key)
+        setattr(self, key, package)
+        return package
 pkg = pkg()
 
 def geometry_config(margin='1.0in'):
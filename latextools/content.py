@@ -1,49 +1,214 @@
 import abc
+import weakref
 
 import fs
 
-from . import str_util, document, project, file
+from . import str_util, document, project, file, requirements
 
 
 INDENT_STEP = ' '*4
 
 
+class _ObservedList(list):
+    '''A list that invalidates the cached output of its owner on change.'''
+    def __init__(self, owner, items=()):
+        super().__init__(items)
+        self._owner = weakref.ref(owner)
+
+    def _changed(self):
+        owner = self._owner()
+        if owner is not None:
+            owner._invalidate()
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+def _observed_method(name):
+    method = getattr(list, name)
+    def observed(self, *args, **kwargs):
+        out = method(self, *args, **kwargs)
+        self._changed()
+        return out
+    observed.__name__ = name
+    return observed
+
+for _name in ('append', 'extend', 'insert', 'remove', 'pop', 'clear', 'sort',
+              'reverse', '__setitem__', '__delitem__', '__iadd__',
+              '__imul__'):
+    setattr(_ObservedList, _name, _observed_method(_name))
+del _name
+
+
 class LatexContentAbc(metaclass=abc.ABCMeta):
+    # List attributes whose in-place changes invalidate the cached output
+    _OBSERVED_LISTS = ('packages', 'commands')
+    # Public attributes that do not affect the output
+    _UNCACHED_ATTRS = ()
+    # Set to False in a subclass to always regenerate the output
+    _CACHE_OUTPUT = True
+
+    _body_cache = None  # Indent -> latex_code_body()
+    _requirements_cache = None
+    _cacheable_cache = None
+    _parents = None
+    _version = 0
+
     def __init__(self, packages, commands, comment=None):
+        '''
+        The base class of document content.
+
+        The output of latex_code_body and the required packages and commands
+        are cached.  Setting a public attribute or changing an observed list
+        attribute invalidates the cache of this content and of every content
+        that contains it.  Other in-place changes (e.g. to NumPy data) require
+        calling invalidate().
+
+        Subclasses that contain other content must return it from
+        list_sub_content() so changes to it invalidate this content, or set
+        _CACHE_OUTPUT = False to opt out of caching.  Content that contains
+        uncached content is not cached either.
+        '''
         self.packages = packages
         self.commands = commands
         self.comment = comment
 
+    def __setattr__(self, name, value):
+        if name.startswith('_') or name in self._UNCACHED_ATTRS:
+            super().__setattr__(name, value)
+            return
+        if name in self._OBSERVED_LISTS and isinstance(value, list):
+            value = _ObservedList(self, value)
+        super().__setattr__(name, value)
+        self._invalidate()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ('_body_cache', '_requirements_cache', '_parents'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for name in self._OBSERVED_LISTS:
+            value = state.get(name)
+            if isinstance(value, list):
+                self.__dict__[name] = _ObservedList(self, value)
+
+    def invalidate(self):
+        '''Discards cached output after an untracked in-place change.'''
+        self._invalidate()
+
+    def _invalidate(self):
+        todo = [self]
+        seen = set()
+        while todo:
+            content = todo.pop()
+            if id(content) in seen:
+                continue
+            seen.add(id(content))
+            content._clear_cache()
+            if content._parents is not None:
+                todo.extend(content._parents)
+
+    def _clear_cache(self):
+        '''Optionally extend in subclass to clear other cached output.'''
+        self._body_cache = None
+        self._requirements_cache = None
+        self._cacheable_cache = None
+        self._version += 1
+
+    def _cacheable(self):
+        '''
+        Returns whether the output of this content and all of its sub content
+        may be cached.
+        '''
+        if self._cacheable_cache is None:
+            self._register_sub_content()
+            self._cacheable_cache = self._CACHE_OUTPUT and all(
+                    sub._cacheable() for sub in self.list_sub_content()
+                    if isinstance(sub, LatexContentAbc))
+        return self._cacheable_cache
+
+    def _register_sub_content(self):
+        '''Makes changes to sub content invalidate this content.'''
+        for sub in self.list_sub_content():
+            if isinstance(sub, LatexContentAbc):
+                if sub._parents is None:
+                    sub._parents = weakref.WeakSet()
+                sub._parents.add(self)
+
     def list_sub_content(self):
-        '''Optionally override in subclass.'''
+        '''
+        Optionally override in subclass.
+
+        Must return all content used to generate the output of this content.
+        Output is cached and only content returned here invalidates it.
+        '''
         return ()
 
+    def _requirements(self):
+        if self._requirements_cache is not None:
+            return self._requirements_cache
+        self._register_sub_content()
+        out = requirements.resolve_requirements([self])
+        if self._cacheable():
+            self._requirements_cache = out
+        return out
+
     def required_packages(self):
-        yield from self.packages
-        for c in self.commands:
-            yield from c.required_packages()
-        for sub in self.list_sub_content():
-            yield from sub.required_packages()
+        yield from self._requirements()[0]
 
     def required_commands(self):
-        yield from self.commands
-        for p in self.packages:
-            yield from p.required_commands()
-        for sub in self.list_sub_content():
-            yield from sub.required_commands()
+        yield from self._requirements()[1]
 
     def get_required_files(self):
         for content in self.list_sub_content():
             yield from content.get_required_files()
 
     def latex_code_body(self, indent=''):
+        if self._body_cache is None:
+            self._body_cache = {}
+        out = self._body_cache.get(indent)
+        if out is not None:
+            return out
+        self._register_sub_content()
         out = ''
         if self.comment:
             out += str_util.prefix_lines(indent+'% ', self.comment)
             out += '\n'
         out += self._latex_code_body(indent=indent).rstrip()
+        if self._cacheable():
+            self._body_cache[indent] = out
         return out
 
+    def write_latex_code_body(self, f, indent=''):
+        '''
+        Writes the same text as latex_code_body to a file or
+        `str_util.LatexWriter` without building it in memory.
+
+        Optionally override _write_latex_code_body in a subclass to stream
+        large content.
+        '''
+        w = str_util.LatexWriter.wrap(f)
+        cached = (None if self._body_cache is None
+                  else self._body_cache.get(indent))
+        if cached is not None:
+            w.write(cached)
+            if w is not f:
+                w.flush()
+            return
+        if self.comment:
+            w.write(str_util.prefix_lines(indent+'% ', self.comment))
+            w.write('\n')
+        mark = w.mark()
+        self._write_latex_code_body(w, indent=indent)
+        w.rstrip_since(mark)
+        if w is not f:
+            w.flush()
+
+    def _write_latex_code_body(self, w, indent=''):
+        w.write(self._latex_code_body(indent=indent))
+
     @abc.abstractmethod
     def _latex_code_body(self, indent=''):
         pass
@@ -53,13 +218,17 @@ class LatexContentAbc(metaclass=abc.ABCMeta):
         return document.LatexDocument(path, config=config, contents=[self])
 
     def as_project(self, path='standalone.tex',
-                   config=document.STANDALONE_CONFIG, proj_fs=None):
+                   config=document.STANDALONE_CONFIG, proj_fs=None,
+                   cache=None, fmt_cache=None):
         return self.as_document(path=path, config=config
-                               ).as_project(proj_fs=proj_fs)
+                               ).as_project(proj_fs=proj_fs, cache=cache,
+                                            fmt_cache=fmt_cache)
 
-    def render(self, config=document.STANDALONE_CONFIG, **pdf_args):
+    def render(self, config=document.STANDALONE_CONFIG, cache=None,
+               fmt_cache=None, **pdf_args):
         fname = 'standalone.tex'
-        proj = self.as_project(path=fname, config=config)
+        proj = self.as_project(path=fname, config=config, cache=cache,
+                               fmt_cache=fmt_cache)
         return proj.compile_pdf(fname=fname, **pdf_args)
 
     def save_pdf(self, path=None, base_dir=None, dst_fs=None, tmp_dir=None,
@@ -92,6 +261,8 @@ class BasicContent(LatexContentAbc):
 
 
 class MultiContent(LatexContentAbc):
+    _OBSERVED_LISTS = LatexContentAbc._OBSERVED_LISTS + ('contents',)
+
     def __init__(self, *contents, comment=None, between='\n\n', pre=None,
                  post=None):
         super().__init__((), (), comment=comment)
@@ -115,6 +286,24 @@ class MultiContent(LatexContentAbc):
             out += self.post
         return out
 
+    def _write_latex_code_body(self, w, indent=''):
+        if self.pre is not None:
+            w.write(self.pre)
+            w.write('\n')
+        first = True
+        for c in self.contents:
+            mark = w.mark()
+            if not first:
+                w.write_separator(self.between)
+            c.write_latex_code_body(w, indent=indent)
+            if w.is_empty_since(mark):
+                w.rstrip_since(mark)
+            else:
+                first = False
+        if self.post is not None:
+            w.write('\n')
+            w.write(self.post)
+
 
 class InputContent(LatexContentAbc):
     def __init__(self, path, content, comment=None):
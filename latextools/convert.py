@@ -1,17 +1,27 @@
 import base64
+import concurrent.futures
+import functools
+import hashlib
+import os
 from pathlib import Path
 import subprocess
 import tempfile
 import re
+import struct
 import urllib
 
 import fs
+import fs.memoryfs
 
 from .project import LatexProject, LatexError
+from .pdf import Pdf
 from .package import LatexPackage
 from .content import BasicContent
 from .document import DocumentConfig
 from .command import LatexCommand
+from . import async_util
+from .cache import RenderCache
+from .inkscape_pool import get_inkscape_pool, inkscape_actions
 
 
 svg_packages = (
@@ -94,11 +104,21 @@ def svg_to_pdf(fname_or_drawing=None, text=None, data=None, file=None,
 
 def _run_inkscape(proj, fpath, cwd,
                  options=('-z', '--export-latex', '--export-type=pdf')):
+    out_path = fpath
+    if not out_path.endswith('.svg'):
+        out_path += '.svg'
+    out_path = out_path[:-4] + '_svg-tex.pdf'
+    pool = get_inkscape_pool()
+    actions = inkscape_actions(options)
+    if pool is not None and actions is not None:
+        try:
+            pool.export(os.path.join(cwd, fpath),
+                        os.path.join(cwd, out_path), actions)
+            return
+        except ValueError:
+            # The path can't be used in shell mode
+            pass
     try:
-        out_path = fpath
-        if not out_path.endswith('.svg'):
-            out_path += '.svg'
-        out_path = out_path[:-4] + '_svg-tex.pdf'
         args = ['inkscape', *options, fpath, '-o', out_path]
         p = subprocess.Popen(args,
                              cwd=cwd,
@@ -121,18 +141,67 @@ class Svg:
     STRIP_CHARS = ('\x00\x01\x02\x03\x04\x05\x06\x07\x08\x0b\x0c\x0e\x0f\x10'
                    '\x11\x12\x13\x14\x15\x16\x17\x18\x19\x1a\x1b\x1c\x1d\x1e'
                    '\x1f')
+    _WIDTH_RE = re.compile(r'width="([0-9]+(.[0-9]+)?)')
+    _HEIGHT_RE = re.compile(r'height="([0-9]+(.[0-9]+)?)')
+    _ID_RE = re.compile(r'(?:id="|="url\(#|xlink:href="#)')
+    _ID_REF_RE = re.compile(r'(id="|="url\(#|xlink:href="#)([^")]*)')
+    # A glyph outline: a symbol or group with an id and no nested groups
+    _GLYPH_RE = re.compile(
+            r'<(symbol|g)\b[^>]*\bid="([^"]+)"[^>]*>(?:(?!<g\b).)*?</\1>',
+            re.DOTALL)
 
     def __init__(self, content):
         self.content = content
-        w_str = next(re.finditer(r'width="([0-9]+(.[0-9]+)?)', self.content)
-                    ).group(1)
-        h_str = next(re.finditer(r'height="([0-9]+(.[0-9]+)?)', self.content)
-                    ).group(1)
-        self.width, self.height = float(w_str)*4/3, float(h_str)*4/3
+        self.size_savings = None
+
+    @property
+    def content(self):
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        self._content = content
+        self._embed_parts = None
+        self._glyph_parts = None
+        self._digest = None
+        self._w_pt = float(self._WIDTH_RE.search(content).group(1))
+        self._h_pt = float(self._HEIGHT_RE.search(content).group(1))
+        self.width, self.height = self._w_pt*4/3, self._h_pt*4/3
+
+    def digest(self):
+        '''Returns a sha256 hex digest of the SVG text.'''
+        if self._digest is None:
+            self._digest = hashlib.sha256(self._content.encode()).hexdigest()
+        return self._digest
 
     def _repr_svg_(self):
         return self.content
 
+    def optimize(self, precision=3):
+        '''
+        Returns a smaller equivalent Svg.
+
+        Coordinates are rounded to precision decimal places, unreferenced
+        definitions and empty groups are dropped, identity transforms are
+        removed, and whitespace between tags is removed.  The defs block is
+        kept so the result still works with to_drawables.  The sizes in
+        characters before and after are stored in the size_savings attribute
+        of the result as a (before, after) tuple.
+        '''
+        content = _round_svg_numbers(self._content, precision)
+        content = _SVG_COMMENT_RE.sub('', content)
+        content = _SVG_IDENTITY_TRANSFORM_RE.sub('', content)
+        content = _drop_unused_defs(content)
+        content = _SVG_SPACE_RE.sub('><', content)
+        while True:
+            new_content = _SVG_EMPTY_GROUP_RE.sub('', content)
+            if new_content == content:
+                break
+            content = new_content
+        svg = Svg(content.strip())
+        svg.size_savings = (len(self._content), len(svg.content))
+        return svg
+
     def save(self, fname):
         with open(fname, 'w') as f:
             f.write(self.content)
@@ -157,9 +226,7 @@ class Svg:
 
     def as_data_uri(self, strip_chars=STRIP_CHARS):
         '''Returns a data URI with base64 encoding.'''
-        data = self.content
-        search = re.compile('|'.join(strip_chars))
-        data_safe = search.sub(lambda m: '', data)
+        data_safe = self.content.translate(_uri_table('', strip_chars))
         b64 = base64.b64encode(data_safe.encode())
         return 'data:image/svg+xml;base64,' + b64.decode(encoding='ascii')
 
@@ -171,29 +238,85 @@ class Svg:
         incorrectly decoded to 'P'.  The characters in `strip_chars` cause the
         SVG not to render even if they are escaped.
         '''
-        data = self.content
         unsafe_chars = (unsafe_chars or '') + '#&%'
-        replacements = {
-            char: urllib.parse.quote(char, safe='')
-            for char in unsafe_chars
-        }
-        replacements.update({
-            char: ''
-            for char in strip_chars
-        })
-        search = re.compile('|'.join(map(re.escape, replacements.keys())))
-        data_safe = search.sub(lambda m: replacements[m.group(0)], data)
+        data_safe = self.content.translate(_uri_table(unsafe_chars,
+                                                      strip_chars))
         return 'data:image/svg+xml;utf8,' + data_safe
 
+    def _split_defs(self):
+        content = self._content
+        defs_start = content.find('<defs>')
+        if defs_start >= 0:
+            defs_end = content.rindex('</defs>')
+            defs_str = content[defs_start+len('<defs>'):defs_end]
+            body_start = content.index('</defs>') + len('</defs>')
+        else:
+            defs_str = ''
+            body_start = content.index('>', content.index('<svg')) + 1
+        return defs_str, content[body_start:content.rindex('</svg>')]
+
+    def _get_embed_parts(self):
+        '''
+        Returns the defs and the body of the SVG with ids prefixed by a
+        digest of the content, computed once.
+        '''
+        if self._embed_parts is None:
+            id_prefix = f'embed-{self.digest()[:16]}-'
+            defs_str, body_str = self._split_defs()
+            add_prefix = lambda m: m.group(0) + id_prefix
+            self._embed_parts = (self._ID_RE.sub(add_prefix, defs_str),
+                                 self._ID_RE.sub(add_prefix, body_str))
+        return self._embed_parts
+
+    def _get_glyph_parts(self):
+        '''
+        Returns a list of (shared id, definition) for each glyph that can be
+        shared between SVGs, the remaining defs, and the body, computed once.
+
+        Glyphs are named by a digest of their definition so identical glyphs
+        from different SVGs get the same id.  Definitions that reference
+        other ids are not shared.
+        '''
+        if self._glyph_parts is None:
+            id_prefix = f'embed-{self.digest()[:16]}-'
+            defs_str, body_str = self._split_defs()
+            id_map = {}
+            shared = []
+            def share_glyph(m):
+                text = m.group(0)
+                if '#' in text:
+                    return text
+                old_id = m.group(2)
+                anon = text.replace(f'id="{old_id}"', 'id=""', 1)
+                digest = hashlib.sha256(anon.encode()).hexdigest()
+                shared_id = f'glyph-{digest[:16]}'
+                id_map[old_id] = shared_id
+                shared.append((shared_id, anon.replace('id=""',
+                                                       f'id="{shared_id}"',
+                                                       1)))
+                return ''
+            defs_str = self._GLYPH_RE.sub(share_glyph, defs_str)
+            defs_str = re.sub(r'<g>\s*</g>', '', defs_str)
+            def rename(m):
+                old_id = m.group(2)
+                return m.group(1) + id_map.get(old_id, id_prefix + old_id)
+            self._glyph_parts = (shared,
+                                 self._ID_REF_RE.sub(rename, defs_str),
+                                 self._ID_REF_RE.sub(rename, body_str))
+        return self._glyph_parts
+
     def to_drawables(self, x=0, y=0, center=False, scale=1,
-                    text_anchor=None, **kwargs):
+                    text_anchor=None, glyphs=None, **kwargs):
+        '''Requires the drawsvg Python package.
+
+        Args:
+            glyphs: An optional GlyphRegistry shared by every Svg drawn in
+                the same drawing so identical glyph outlines are only
+                included once.
+        '''
         import drawsvg as draw
         scale = scale*4/3  # Points to pixels
-        w_str = next(re.finditer(r'width="([0-9]+(.[0-9]+)?)', self.content)
-                    ).group(1)
-        h_str = next(re.finditer(r'height="([0-9]+(.[0-9]+)?)', self.content)
-                    ).group(1)
-        w, h = float(w_str), float(h_str)
+        w, h = self._w_pt, self._h_pt
         x_off, y_off = 0, 0
         if center:
             x_off, y_off = -w/2, -h/2
@@ -206,18 +329,15 @@ class Svg:
         elif text_anchor == 'end':
             x_off = -w
 
-        id_prefix = f'embed-{hash(self.content)}-'
-        content = (self.content
-                    .replace('id="', f'id="{id_prefix}')
-                    .replace('="url(#', f'="url(#{id_prefix}')
-                    .replace('xlink:href="#', f'xlink:href="#{id_prefix}'))
-        defs_str = next(re.finditer(r'<defs>(.*)</defs>', content,
-                                    re.MULTILINE | re.DOTALL)
-                       ).group(1)
-        elems_str = next(re.finditer(r'</defs>(.*)</svg>', content,
-                                     re.MULTILINE | re.DOTALL)
-                        ).group(1)
-        defs = draw.Raw(defs_str)
+        if glyphs is None:
+            defs_str, elems_str = self._get_embed_parts()
+            defs = (draw.Raw(defs_str),)
+        else:
+            shared, defs_str, elems_str = self._get_glyph_parts()
+            defs = tuple(glyphs.get_def(shared_id, text)
+                         for shared_id, text in shared)
+            if defs_str.strip():
+                defs = (*defs, draw.Raw(defs_str))
 
         transforms = []
         if 'transform' in kwargs:
@@ -229,14 +349,112 @@ class Svg:
             transforms.append(f'translate({x_off}, {y_off})')
         kwargs['transform'] = ' '.join(transforms)
 
-        elems = draw.Raw(elems_str, (defs,))
+        elems = draw.Raw(elems_str, defs)
         wrap = draw.Group([elems], **kwargs)
         return (wrap,)
 
 
-def pdf_to_svg(fname_or_obj=None, text=None, data=None, file=None,
-               out_name=None, ret_svg=True):
-    '''Requires the pdf2svg command line tool.'''
+class GlyphRegistry:
+    def __init__(self):
+        '''
+        Glyph definitions shared by many Svg objects in one drawing.
+
+        Pass the same registry as the glyphs argument of every
+        `Svg.to_drawables` (or `Pdf.to_drawables`) call for a drawing.  Each
+        unique glyph outline is then written once and every embedded SVG
+        refers to it.
+        '''
+        self._defs = {}  # Shared id -> drawsvg element
+
+    def get_def(self, shared_id, text):
+        d = self._defs.get(shared_id)
+        if d is None:
+            import drawsvg as draw
+            d = draw.Raw(text)
+            self._defs[shared_id] = d
+        return d
+
+    def __len__(self):
+        return len(self._defs)
+
+
+class Png:
+    def __init__(self, data):
+        '''A PNG image such as one returned by `pdf_to_png`.'''
+        self.data = data
+        # Image size in pixels from the IHDR chunk
+        self.width, self.height = struct.unpack('>II', data[16:24])
+
+    def save(self, fname):
+        with open(fname, 'wb') as f:
+            f.write(self.data)
+
+    def as_data_uri(self):
+        '''Returns a data URI with base64 encoding.'''
+        b64 = base64.b64encode(self.data)
+        return 'data:image/png;base64,' + b64.decode(encoding='ascii')
+
+    def _repr_png_(self):
+        return self.data
+
+
+_SVG_NUMBER_ATTR_RE = re.compile(
+        r'\b(d|x|y|x1|y1|x2|y2|cx|cy|r|rx|ry|width|height|points|viewBox'
+        r'|transform)="([^"]*)"')
+_SVG_NUMBER_RE = re.compile(
+        r'-?(?:[0-9]+\.[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+_SVG_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_SVG_IDENTITY_TRANSFORM_RE = re.compile(
+        r'\s+transform="\s*(?:matrix\(\s*1[ ,]+0[ ,]+0[ ,]+1[ ,]+0[ ,]+0\s*\)'
+        r'|translate\(\s*0(?:[ ,]+0)?\s*\)|scale\(\s*1(?:[ ,]+1)?\s*\))\s*"')
+_SVG_SPACE_RE = re.compile(r'>\s+<')
+_SVG_EMPTY_GROUP_RE = re.compile(r'<g\b(?:(?!\bid=")[^>])*(?:/>|>\s*</g>)')
+_SVG_DEF_RE = re.compile(
+        r'<(\w+)\b[^>]*\bid="([^"]+)"[^>]*?(?:/>|>(?:(?!<\1\b).)*?</\1>)',
+        re.DOTALL)
+_SVG_REF_RE = re.compile(r'(?:href="#|url\(#)([^")]*)')
+
+def _round_svg_numbers(content, precision):
+    def round_number(m):
+        out = f'{float(m.group(0)):.{precision}f}'
+        if '.' in out:
+            out = out.rstrip('0').rstrip('.')
+        return '0' if out == '-0' else out
+    def round_attr(m):
+        value = _SVG_NUMBER_RE.sub(round_number, m.group(2))
+        if m.group(1) == 'd':
+            value = ' '.join(value.split())
+        return f'{m.group(1)}="{value}"'
+    return _SVG_NUMBER_ATTR_RE.sub(round_attr, content)
+
+def _drop_unused_defs(content):
+    start = content.find('<defs>')
+    if start < 0:
+        return content
+    start += len('<defs>')
+    end = content.rindex('</defs>')
+    defs = content[start:end]
+    while True:
+        rest = content[:start] + content[end:]
+        used = set(_SVG_REF_RE.findall(rest))
+        used.update(_SVG_REF_RE.findall(defs))
+        new_defs = _SVG_DEF_RE.sub(
+                lambda m: m.group(0) if m.group(2) in used else '', defs)
+        if new_defs == defs:
+            break
+        defs = new_defs
+    return content[:start] + defs + content[end:]
+
+
+@functools.lru_cache(maxsize=None)
+def _uri_table(unsafe_chars, strip_chars):
+    table = {ord(char): urllib.parse.quote(char, safe='')
+             for char in unsafe_chars}
+    table.update({ord(char): None for char in strip_chars})
+    return table
+
+
+def _pdf_input(fname_or_obj, text, data, file):
     if ((fname_or_obj is not None)
             + (text is not None)
             + (data is not None)
@@ -253,32 +471,425 @@ def pdf_to_svg(fname_or_obj=None, text=None, data=None, file=None,
             fname = fname_or_obj.fname
         else:
             data = fname_or_obj.data
+    return fname, text, data, file
+
+def _write_pdf_input(tmp_fs, path, fname, text, data, file):
+    if fname is not None:
+        with open(fname, 'rb') as f:
+            tmp_fs.writefile(path, f)
+    elif file is not None:
+        tmp_fs.writefile(path, file)
+    elif data is not None:
+        tmp_fs.writebytes(path, data)
+    elif text is not None:
+        tmp_fs.writetext(path, text)
+    else:
+        assert False, 'Logic error'
+
+def _run_pdf2svg(args, cwd):
+    try:
+        p = subprocess.Popen(['pdf2svg', *args],
+                             cwd=cwd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise LatexError('pdf2svg command not found.')
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        # pdf2svg had an error
+        msg = ''
+        if stdout:
+            msg += stdout.decode()
+        if stderr:
+            msg += stderr.decode()
+        raise RuntimeError(msg)
+
+def _check_pages(pages):
+    if pages is not None and pages != 'all' and len(pages) == 0:
+        raise ValueError('pages must not be empty')
+
+def _pdf2svg_args(pages):
+    '''Returns the arguments of each pdf2svg invocation needed for pages.'''
+    if pages is None:
+        return [['image.pdf', 'image.svg']]
+    if pages == 'all':
+        # Convert every page in one invocation
+        return [['image.pdf', 'image-%d.svg', 'all']]
+    # pdf2svg converts one page or all pages so only convert those requested
+    return [['image.pdf', f'image-{page}.svg', str(page)]
+            for page in dict.fromkeys(pages)]
+
+def _page_out_name(out_name, page, default_ext='.svg'):
+    if '%d' in out_name:
+        return out_name % page
+    base, ext = os.path.splitext(out_name)
+    return f'{base}-{page}{ext or default_ext}'
+
+def _read_svgs(tmp_fs, pages, out_name, ret_svg):
+    if pages is None:
+        if out_name is not None:
+            fs.copy.copy_file(tmp_fs, 'image.svg', '.', out_name)
+        if ret_svg:
+            return Svg(tmp_fs.readtext('image.svg'))
+        return None
+    if pages == 'all':
+        pages = []
+        while tmp_fs.exists(f'image-{len(pages)+1}.svg'):
+            pages.append(len(pages)+1)
+    svgs = []
+    for page in pages:
+        svg_fname = f'image-{page}.svg'
+        if not tmp_fs.exists(svg_fname):
+            raise ValueError(f'PDF has no page {page}')
+        if out_name is not None:
+            fs.copy.copy_file(tmp_fs, svg_fname, '.',
+                              _page_out_name(out_name, page))
+        if ret_svg:
+            svgs.append(Svg(tmp_fs.readtext(svg_fname)))
+    return svgs if ret_svg else None
+
+def _pdf_bytes(fname, text, data, file):
     if fname is not None:
-        with open(fname, 'b') as f:
-            pdf_to_svg(file=f, out_name=out_name)
+        with open(fname, 'rb') as f:
+            return f.read()
+    elif file is not None:
+        return file.read()
+    elif text is not None:
+        return text.encode()
+    return data
+
+def _svg_cache_key(pdf_data, pages):
+    if pages is not None and pages != 'all':
+        pages = ','.join(map(str, pages))
+    return RenderCache.make_key('pdf2svg', pdf_data, pages)
+
+def pdf_to_svg(fname_or_obj=None, text=None, data=None, file=None,
+               out_name=None, ret_svg=True, pages=None, cache=None,
+               optimize=False, precision=3):
+    '''Requires the pdf2svg command line tool.
+
+    By default, converts the first page and returns an Svg.  If pages is
+    'all' or a list of page numbers (starting from 1), returns a list of Svg
+    objects, one per page.  'all' is converted by a single pdf2svg
+    invocation and a list by one invocation per page.  For multiple pages,
+    out_name may contain `%d` for the page number.
+
+    If cache (a `latextools.RenderCache`) is given, the SVG output is stored
+    under a digest of the PDF bytes so identical PDFs are only converted
+    once, even across processes.
+
+    If optimize is True, each Svg is shrunk with `Svg.optimize` using the
+    given coordinate precision.  Files saved to out_name are not optimized.
+    '''
+    _check_pages(pages)
+    out = _pdf_to_svg(fname_or_obj, text, data, file, out_name, ret_svg,
+                      pages, cache)
+    if optimize and ret_svg:
+        if isinstance(out, list):
+            return [svg.optimize(precision) for svg in out]
+        return out.optimize(precision)
+    return out
+
+def _pdf_to_svg(fname_or_obj, text, data, file, out_name, ret_svg, pages,
+                cache):
+    fname, text, data, file = _pdf_input(fname_or_obj, text, data, file)
+
+    if cache is not None:
+        data = _pdf_bytes(fname, text, data, file)
+        fname = text = file = None
+        key = _svg_cache_key(data, pages)
+        files = cache.get(key)
+        if files is not None:
+            with fs.memoryfs.MemoryFS() as mem_fs:
+                for name, svg_data in files.items():
+                    mem_fs.writebytes(name, svg_data)
+                return _read_svgs(mem_fs, pages, out_name, ret_svg)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_fs = fs.open_fs(tmp_dir, writeable=True)
+        _write_pdf_input(tmp_fs, 'image.pdf', fname, text, data, file)
+
+        for args in _pdf2svg_args(pages):
+            _run_pdf2svg(args, cwd=tmp_dir)
+
+        if cache is not None:
+            cache.put(key, {name: tmp_fs.readbytes(name)
+                            for name in tmp_fs.listdir('/')
+                            if name.endswith('.svg')})
+        return _read_svgs(tmp_fs, pages, out_name, ret_svg)
+
+async def pdf_to_svg_async(fname_or_obj=None, text=None, data=None, file=None,
+                           out_name=None, ret_svg=True, pages=None,
+                           semaphore=None):
+    '''Coroutine version of `pdf_to_svg`.
+
+    Cancelling the task kills the pdf2svg process.
+    '''
+    _check_pages(pages)
+    fname, text, data, file = _pdf_input(fname_or_obj, text, data, file)
 
     with tempfile.TemporaryDirectory() as tmp_dir:
         tmp_fs = fs.open_fs(tmp_dir, writeable=True)
-        if file is not None:
-            tmp_fs.writefile('image.pdf', file)
-        elif data is not None:
-            tmp_fs.writebytes('image.pdf', data)
-        elif text is not None:
-            tmp_fs.writetext('image.pdf', text)
+        _write_pdf_input(tmp_fs, 'image.pdf', fname, text, data, file)
+
+        await async_util.gather_or_cancel(*(
+                async_util.run_process(
+                        ['pdf2svg', *args], cwd=tmp_dir,
+                        not_found_msg='pdf2svg command not found.',
+                        error_type=RuntimeError, semaphore=semaphore)
+                for args in _pdf2svg_args(pages)))
+
+        return _read_svgs(tmp_fs, pages, out_name, ret_svg)
+
+def pdfs_to_svgs(pdfs, max_workers=None, cache=None):
+    '''Converts the first page of each of many PDFs to an Svg.
+
+    Requires the pdf2svg command line tool.  All PDFs share one temporary
+    workspace and up to max_workers (default: the CPU count) pdf2svg
+    processes run at once.  Identical PDFs are only converted once.
+
+    Args:
+        pdfs: A list of Pdf objects, file names, or PDF bytes.
+        cache: An optional `latextools.RenderCache` as in `pdf_to_svg`.
+    '''
+    inputs = []
+    for pdf in pdfs:
+        if isinstance(pdf, bytes):
+            inputs.append((None, pdf))
         else:
-            assert False, 'Logic error'
+            fname, _, data, _ = _pdf_input(pdf, None, None, None)
+            if cache is not None and fname is not None:
+                fname, data = None, _pdf_bytes(fname, None, None, None)
+            inputs.append((fname, data))
+    unique = list(dict.fromkeys(inputs))
+    svg_map = {}
+    if cache is not None:
+        keys = {(fname, data): _svg_cache_key(data, None)
+                for fname, data in unique}
+        for key in unique:
+            files = cache.get(keys[key])
+            if files is not None:
+                svg_map[key] = Svg(files['image.svg'].decode())
+        unique = [key for key in unique if key not in svg_map]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_fs = fs.open_fs(tmp_dir, writeable=True)
+        for i, (fname, data) in enumerate(unique):
+            _write_pdf_input(tmp_fs, f'image-{i}.pdf', fname, None, data,
+                             None)
+
+        def convert(i):
+            _run_pdf2svg([f'image-{i}.pdf', f'image-{i}.svg'], cwd=tmp_dir)
+            svg_data = tmp_fs.readbytes(f'image-{i}.svg')
+            if cache is not None:
+                cache.put(keys[unique[i]], {'image.svg': svg_data})
+            return Svg(svg_data.decode())
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            svgs = list(executor.map(convert, range(len(unique))))
+    svg_map.update(zip(unique, svgs))
+    return [svg_map[key] for key in inputs]
+
+
+RASTER_BACKENDS = ('auto', 'pdftoppm', 'mupdf')
+
+def _import_mupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    return pymupdf
 
-        args = ['pdf2svg', 'image.pdf', 'image.svg']
+def _raster_backend(backend):
+    if backend == 'auto':
+        try:
+            _import_mupdf()
+        except ImportError:
+            return 'pdftoppm'
+        return 'mupdf'
+    if backend not in RASTER_BACKENDS:
+        raise ValueError(f'Unknown raster backend: {backend!r}, expected one '
+                         f'of {RASTER_BACKENDS}')
+    return backend
+
+def _run_pdftoppm(args, cwd):
+    try:
+        p = subprocess.Popen(['pdftoppm', *args],
+                             cwd=cwd,
+                             stdout=subprocess.PIPE,
+                             stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise LatexError('pdftoppm command not found.')
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        # pdftoppm had an error
+        msg = ''
+        if stdout:
+            msg += stdout.decode()
+        if stderr:
+            msg += stderr.decode()
+        raise RuntimeError(msg)
+
+def _pdftoppm_pngs(tmp_fs, pdf_name, pages, dpi, prefix):
+    '''Returns a dict of page number -> PNG bytes.'''
+    args = ['-png', '-r', str(dpi)]
+    if pages == 'all':
+        ranges = [()]
+    else:
+        # One invocation per contiguous run of requested pages
+        ranges = []
+        for page in sorted(set(pages)):
+            if ranges and ranges[-1][1] == page - 1:
+                ranges[-1][1] = page
+            else:
+                ranges.append([page, page])
+        ranges = [('-f', str(first), '-l', str(last))
+                  for first, last in ranges]
+    for page_args in ranges:
+        _run_pdftoppm([*args, *page_args, pdf_name, prefix],
+                      cwd=tmp_fs.getsyspath('/'))
+    # pdftoppm zero pads page numbers to the digits of the page count
+    name_re = re.compile(re.escape(prefix) + r'-([0-9]+)\.png')
+    png_map = {}
+    for name in tmp_fs.listdir('/'):
+        m = name_re.fullmatch(name)
+        if m is not None:
+            png_map[int(m.group(1))] = tmp_fs.readbytes(name)
+    return png_map
+
+def _mupdf_pngs(pdf_data, pages, dpi):
+    '''Returns a dict of page number -> PNG bytes.'''
+    pymupdf = _import_mupdf()
+    zoom = dpi / 72
+    png_map = {}
+    with pymupdf.open(stream=pdf_data, filetype='pdf') as doc:
+        if pages == 'all':
+            pages = range(1, doc.page_count+1)
+        for page in pages:
+            if 1 <= page <= doc.page_count:
+                pix = doc[page-1].get_pixmap(
+                        matrix=pymupdf.Matrix(zoom, zoom))
+                png_map[page] = pix.tobytes('png')
+    return png_map
+
+def _read_pngs(png_map, pages, out_name, ret_png):
+    page_list = [1] if pages is None else pages
+    if page_list == 'all':
+        page_list = sorted(png_map)
+    pngs = []
+    for page in page_list:
+        if page not in png_map:
+            raise ValueError(f'PDF has no page {page}')
+        if out_name is not None:
+            with open(out_name if pages is None
+                      else _page_out_name(out_name, page, '.png'), 'wb') as f:
+                f.write(png_map[page])
+        if ret_png:
+            pngs.append(Png(png_map[page]))
+    if not ret_png:
+        return None
+    return pngs[0] if pages is None else pngs
+
+def pdf_to_png(fname_or_obj=None, text=None, data=None, file=None,
+               out_name=None, ret_png=True, pages=None, dpi=96,
+               backend='auto'):
+    '''Rasterizes a PDF directly without converting it to SVG.
+
+    Requires the pdftoppm command line tool (from poppler-utils) or the
+    PyMuPDF Python package.  Pages are selected as in `pdf_to_svg`: by
+    default the first page is converted and a Png is returned, and if pages
+    is 'all' or a list of page numbers a list of Png objects is returned.
+    Each contiguous run of pages is converted by one pdftoppm invocation.
+
+    Args:
+        dpi: The resolution.  96 gives the same size as `Svg.rasterize`.
+        backend: 'pdftoppm', 'mupdf', or 'auto' to use PyMuPDF when it is
+            installed and pdftoppm otherwise.
+    '''
+    _check_pages(pages)
+    fname, text, data, file = _pdf_input(fname_or_obj, text, data, file)
+    page_list = [1] if pages is None else pages
+
+    if _raster_backend(backend) == 'mupdf':
+        png_map = _mupdf_pngs(_pdf_bytes(fname, text, data, file), page_list,
+                              dpi)
+        return _read_pngs(png_map, pages, out_name, ret_png)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_fs = fs.open_fs(tmp_dir, writeable=True)
+        _write_pdf_input(tmp_fs, 'image.pdf', fname, text, data, file)
+        png_map = _pdftoppm_pngs(tmp_fs, 'image.pdf', page_list, dpi, 'image')
+        return _read_pngs(png_map, pages, out_name, ret_png)
+
+def pdfs_to_pngs(pdfs, dpi=96, max_workers=None, backend='auto'):
+    '''Rasterizes the first page of each of many PDFs to a Png.
+
+    With pdftoppm, all PDFs share one temporary workspace and up to
+    max_workers (default: the CPU count) processes run at once.  PyMuPDF
+    documents are not thread safe so that backend converts one PDF at a
+    time.  Identical PDFs are only converted once.
+
+    Args:
+        pdfs: A list of Pdf objects, file names, or PDF bytes.
+        dpi: The resolution as in `pdf_to_png`.
+        backend: The backend as in `pdf_to_png`.
+    '''
+    inputs = []
+    for pdf in pdfs:
+        if isinstance(pdf, bytes):
+            inputs.append((None, pdf))
+        else:
+            fname, _, data, _ = _pdf_input(pdf, None, None, None)
+            inputs.append((fname, data))
+    unique = list(dict.fromkeys(inputs))
+    if _raster_backend(backend) == 'mupdf':
+        pngs = [_read_pngs(_mupdf_pngs(_pdf_bytes(fname, None, data, None),
+                                       [1], dpi),
+                           None, None, True)
+                for fname, data in unique]
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_fs = fs.open_fs(tmp_dir, writeable=True)
+            for i, (fname, data) in enumerate(unique):
+                _write_pdf_input(tmp_fs, f'image-{i}.pdf', fname, None, data,
+                                 None)
+
+            def convert(i):
+                png_map = _pdftoppm_pngs(tmp_fs, f'image-{i}.pdf', [1], dpi,
+                                         f'image-{i}')
+                return _read_pngs(png_map, None, None, True)
+            if max_workers is None:
+                max_workers = os.cpu_count() or 1
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers) as executor:
+                pngs = list(executor.map(convert, range(len(unique))))
+    png_map = dict(zip(unique, pngs))
+    return [png_map[key] for key in inputs]
+
+
+def split_pdf_pages(fname_or_obj=None, text=None, data=None, file=None,
+                    **pdf_args):
+    '''Splits a PDF into a list of single page Pdf objects.
+
+    Requires the pdfseparate command line tool (from poppler-utils).
+    '''
+    fname, text, data, file = _pdf_input(fname_or_obj, text, data, file)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_fs = fs.open_fs(tmp_dir, writeable=True)
+        _write_pdf_input(tmp_fs, 'image.pdf', fname, text, data, file)
+
+        args = ['pdfseparate', 'image.pdf', 'page-%d.pdf']
         try:
             p = subprocess.Popen(args,
                                  cwd=tmp_dir,
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE)
         except FileNotFoundError:
-            raise LatexError('pdf2svg command not found.')
+            raise LatexError('pdfseparate command not found.')
         stdout, stderr = p.communicate()
         if p.returncode != 0:
-            # pdf2svg had an error
+            # pdfseparate had an error
             msg = ''
             if stdout:
                 msg += stdout.decode()
@@ -286,12 +897,11 @@ def pdf_to_svg(fname_or_obj=None, text=None, data=None, file=None,
                 msg += stderr.decode()
             raise RuntimeError(msg)
 
-        if out_name is not None:
-            fs.copy.copy_file(tmp_fs, 'image.svg', '.', out_name)
-
-        if ret_svg:
-            return Svg(tmp_fs.readtext('image.svg'))
-
+        pages = []
+        while tmp_fs.exists(f'page-{len(pages)+1}.pdf'):
+            data = tmp_fs.readbytes(f'page-{len(pages)+1}.pdf')
+            pages.append(Pdf(data=data, **pdf_args))
+        return pages
 
 def render_latex_in_svg(name_or_drawing=None, text=None, data=None, file=None,
                         fit_drawing=False, latex_width=None, out_name=None,
@@ -311,7 +921,8 @@ def svg_to_png(name_or_drawing=None, text=None, data=None, file=None,
     png = svg.rasterize(out_name)
     return png
 
-def text_to_svg(latex_text, config=DocumentConfig('standalone'), fill=None):
+def text_to_svg(latex_text, config=DocumentConfig('standalone'), fill=None,
+                cache=None, fmt_cache=None, optimize=False, precision=3):
     color = fill
     commands = list(svg_commands)
     color_command = None
@@ -330,5 +941,6 @@ def text_to_svg(latex_text, config=DocumentConfig('standalone'), fill=None):
         latex_text = fr'\color{{{color}}}{latex_text}'
 
     content = BasicContent(latex_text, svg_packages, commands)
-    pdf = content.render(config=config)
-    return pdf_to_svg(pdf)
+    pdf = content.render(config=config, cache=cache, fmt_cache=fmt_cache)
+    return pdf_to_svg(pdf, cache=cache, optimize=optimize,
+                      precision=precision)
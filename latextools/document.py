@@ -1,5 +1,7 @@
+import fs
+
 from .file import LatexFileAbc
-from . import project
+from . import project, requirements, str_util
 
 
 class DocumentConfig:
@@ -19,44 +21,47 @@ class LatexDocument(LatexFileAbc):
         self.config = config
         self.contents = list(contents)
 
+    def resolve_requirements(self):
+        '''Returns the sorted packages and commands used by this document.'''
+        return requirements.resolve_requirements(
+                (*self.contents, *self.config.packages,
+                 *self.config.commands))
+
     def sorted_packages(self):
-        packages = set(p for content in self.contents
-                         for p in content.required_packages())
-        packages.update(self.config.packages)
-        packages.update(p for c in self.config.commands
-                          for p in c.required_packages())
-        return sorted(packages)
+        return self.resolve_requirements()[0]
 
     def sorted_commands(self):
-        commands = set(c for content in self.contents
-                         for c in content.required_commands())
-        commands.update(self.config.commands)
-        commands.update(c for p in self.config.packages
-                          for c in p.required_packages())
-        return sorted(commands)
+        return self.resolve_requirements()[1]
 
     def _gen_preamble_blocks(self):
-        packages = self.sorted_packages()
+        packages, commands = self.resolve_requirements()
         yield '\n'.join(filter(bool, (p.latex_code_import()
                                       for p in packages)))
 
         yield from filter(bool, (p.latex_code_setup()
-                                 for p in self.sorted_commands()))
+                                 for p in commands))
 
         yield from filter(bool, (p.latex_code_setup()
                                  for p in packages))
 
-    def _gen_blocks(self):
+    def get_document_class(self):
         options = self.config.options
         options_str = '' if not options else f'[{",".join(options)}]'
-        yield f'\documentclass{options_str}{{{self.config.doc_type}}}'
+        return f'\documentclass{options_str}{{{self.config.doc_type}}}'
+
+    def _gen_blocks(self, stream=False):
+        yield self.get_document_class()
 
         yield from self._gen_preamble_blocks()
 
+        yield from self._gen_body_blocks(stream=stream)
+
+    def _gen_body_blocks(self, stream=False):
+        '''Yields strings or, if stream is true, content objects.'''
         yield r'\begin{document}'
 
         for content in self.contents:
-            yield content.latex_code_body(indent='')
+            yield content if stream else content.latex_code_body(indent='')
 
         yield r'\end{document}'
 
@@ -70,17 +75,68 @@ class LatexDocument(LatexFileAbc):
         out += '\n'
         return out
 
+    def write_content(self, f):
+        '''
+        Writes the same text as get_content to f, streaming the body content
+        instead of building the whole source in memory.
+        '''
+        self.write_header(f)
+        w = str_util.LatexWriter(f)
+        first = True
+        for block in self._gen_blocks(stream=True):
+            mark = w.mark()
+            if not first:
+                w.write_separator('\n\n')
+            block_mark = w.mark()
+            if isinstance(block, str):
+                w.write(block)
+            else:
+                block.write_latex_code_body(w, indent='')
+            w.rstrip_since(block_mark)
+            if w.is_empty_since(mark):
+                w.rstrip_since(mark)
+            else:
+                first = False
+        f.write('\n')
+
+    def get_body(self):
+        '''Returns the document source starting from `\\begin{document}`.'''
+        out = '\n\n'.join(filter(bool, map(str.rstrip,
+                                           self._gen_body_blocks())))
+        out += '\n'
+        return out
+
     def get_required_files(self):
         for content in self.contents:
             yield from content.get_required_files()
 
-    def as_project(self, proj_fs=None):
-        proj = project.LatexProject(proj_fs=proj_fs)
-        proj.add_file(self)
+    def as_project(self, proj_fs=None, cache=None, fmt_cache=None):
+        '''
+        Returns a LatexProject containing this document.
+
+        If fmt_cache (a `latextools.FormatCache`) is given, the preamble is
+        loaded from a precompiled format file instead of being written to the
+        document source.  pdflatex finds the format in the cache directory so
+        it is not copied into the project, and the render cache key includes
+        the format name, which is a digest of the preamble.
+        '''
+        if fmt_cache is None:
+            proj = project.LatexProject(proj_fs=proj_fs, cache=cache)
+            proj.add_file(self)
+            return proj
+        proj = project.LatexProject(proj_fs=proj_fs, cache=cache,
+                                    format_dir=fmt_cache.cache_dir)
+        fmt_path = fmt_cache.get_format(self)
+        fmt_fname = fs.path.basename(fmt_path)
+        for f in self.get_required_files():
+            proj.add_file(f)
+        # The first line selects the format to load
+        proj.add_file(self.path,
+                      text=f'%&{fmt_fname[:-4]}\n' + self.get_body())
         return proj
 
-    def render(self, **pdf_args):
-        proj = self.as_project()
+    def render(self, cache=None, fmt_cache=None, **pdf_args):
+        proj = self.as_project(cache=cache, fmt_cache=fmt_cache)
         return proj.compile_pdf(fname=self.path, **pdf_args)
 
     def save_pdf(self, base_dir=None, dst_fs=None, tmp_dir=None):
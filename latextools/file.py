@@ -1,4 +1,7 @@
 import abc
+import hashlib
+import os
+import shutil
 
 from . import str_util
 
@@ -47,47 +50,125 @@ class FileAbc(metaclass=abc.ABCMeta):
         return ()
 
 
-class BinaryFile(FileAbc):
+class _SourceFile(FileAbc, metaclass=abc.ABCMeta):
+    chunk_size = 2**16
+
+    def __init__(self, path, content=None, fname=None):
+        '''
+        A file with contents given directly or read lazily from a file name.
+
+        Only the file name is kept and the file is streamed in chunks when the
+        project is written.
+        '''
+        super().__init__(path)
+        self.fname = fname
+        self._content = content
+        self._digest = None  # (stat key, digest)
+
+    def _open(self):
+        return open(self.fname, 'r' if self.is_text() else 'rb')
+
+    def _set_content(self, content):
+        self.fname = None
+        self._content = content
+        self._digest = None
+
+    def _stat_key(self):
+        if self.fname is None:
+            return None
+        st = os.stat(self.fname)
+        return st.st_size, st.st_mtime_ns
+
+    def get_content(self):
+        if self._content is None:
+            with self._open() as f:
+                return f.read()
+        return self._content
+
+    def write_content(self, f):
+        if self._content is None:
+            with self._open() as src:
+                shutil.copyfileobj(src, f, self.chunk_size)
+        else:
+            f.write(self._content)
+
+    def size(self):
+        '''Returns the size of this file in bytes.'''
+        if self._content is None:
+            return os.path.getsize(self.fname)
+        if self.is_text():
+            return len(self._content.encode())
+        return len(self._content)
+
+    def digest(self):
+        '''
+        Returns a sha256 hex digest of the contents.
+
+        The digest of a file given by name is cached until its size or
+        modification time changes.
+        '''
+        key = self._stat_key()
+        if self._digest is not None and self._digest[0] == key:
+            return self._digest[1]
+        h = hashlib.sha256()
+        if self._content is None:
+            with open(self.fname, 'rb') as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                    h.update(chunk)
+        elif self.is_text():
+            h.update(self._content.encode())
+        else:
+            h.update(self._content)
+        self._digest = key, h.hexdigest()
+        return self._digest[1]
+
+
+class BinaryFile(_SourceFile):
     def __init__(self, path, data=None, fname=None):
         if (fname is not None) + (data is not None) != 1:
             raise TypeError('Specify either fname or data.')
-        super().__init__(path)
-        if data is None:
-            with open(fname, 'rb') as f:
-                data = f.read()
-        self.data = data
+        super().__init__(path, content=data, fname=fname)
+
+    @property
+    def data(self):
+        return self.get_content()
+
+    @data.setter
+    def data(self, data):
+        self._set_content(data)
 
     def is_text(self):
         return False
 
-    def get_content(self):
-        return self.data
-
 
-class PlainTextFile(FileAbc):
+class PlainTextFile(_SourceFile):
     def __init__(self, path, text=None, fname=None):
         if (fname is not None) + (text is not None) != 1:
             raise TypeError('Specify either fname or text.')
-        super().__init__(path)
-        if text is None:
-            with open(fname, 'r') as f:
-                text = f.read()
-        self.text = text
+        super().__init__(path, content=text, fname=fname)
+
+    @property
+    def text(self):
+        return self.get_content()
+
+    @text.setter
+    def text(self, text):
+        self._set_content(text)
 
     def is_text(self):
         return True
 
-    def get_content(self):
-        return self.text
-
 
 class LatexFileAbc(FileAbc, metaclass=abc.ABCMeta):
     def write_content(self, f):
+        self.write_header(f)
+        f.write(self.get_content())
+
+    def write_header(self, f):
         f.write('% This file was automatically generated by python latextools.'
                 '\n'
                 '% https://github.com/cduck/latextools'
                 '\n%\n')
-        f.write(self.get_content())
 
     def is_text(self):
         return True
@@ -97,13 +178,34 @@ class InputFile(LatexFileAbc):
     def __init__(self, path, content):
         super().__init__(path)
         self.content = content
+        self._cache = None  # (content, content version, output)
 
     def get_content(self):
+        content, version = self.content, self.content._version
+        if (self._cache is not None and self._cache[0] is content
+                and self._cache[1] == version):
+            return self._cache[2]
         out = str_util.prefix_lines('% ',
                                     self.content.as_document().get_preamble())
         out += '\n%\n'
         out += self.content.latex_code_body() + '\n'
+        if content._cacheable():
+            self._cache = content, version, out
         return out
 
+    def write_content(self, f):
+        content, version = self.content, self.content._version
+        if (self._cache is not None and self._cache[0] is content
+                and self._cache[1] == version):
+            super().write_content(f)
+            return
+        # Stream the body instead of building it in memory
+        self.write_header(f)
+        f.write(str_util.prefix_lines(
+                    '% ', content.as_document().get_preamble()))
+        f.write('\n%\n')
+        content.write_latex_code_body(f)
+        f.write('\n')
+
     def get_required_files(self):
         return self.content.get_required_files()
@@ -0,0 +1,85 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+from .cache import RenderCache, pdflatex_version
+from .project import LatexError
+
+
+class FormatCache:
+    def __init__(self, cache_dir,
+                 options=('-halt-on-error', '-file-line-error',
+                          '-interaction', 'nonstopmode')):
+        '''
+        A directory of precompiled pdflatex format (.fmt) files.
+
+        Each format contains the document class and preamble of a
+        LatexDocument, dumped with `pdflatex -ini`.  Documents with the same
+        class options, packages, and commands share one format so later
+        compiles skip loading the preamble.  Compiling with a format requires
+        pdflatex to parse the `%&format` first line of the main file (the
+        default in TeX Live).
+
+        Args:
+            cache_dir: The directory to store format files in.  It is created
+                if it does not exist.
+            options: Extra pdflatex options used when dumping a format.
+        '''
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.options = tuple(options)
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def format_key(self, doc):
+        return RenderCache.make_key(doc.get_document_class(),
+                                    doc.get_preamble(),
+                                    '\0'.join(self.options),
+                                    pdflatex_version())
+
+    def get_format(self, doc):
+        '''
+        Returns the path to the format file for doc, creating it if needed.
+        '''
+        name = f'preamble-{self.format_key(doc)[:32]}'
+        fmt_path = os.path.join(self.cache_dir, f'{name}.fmt')
+        if not os.path.exists(fmt_path):
+            self._dump_format(doc, name, fmt_path)
+        return fmt_path
+
+    def _dump_format(self, doc, name, fmt_path):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            src_path = os.path.join(tmp_dir, f'{name}.tex')
+            with open(src_path, 'w') as f:
+                f.write(doc.get_document_class())
+                f.write('\n\n')
+                f.write(doc.get_preamble())
+                f.write('\n\n\\dump\n')
+            args = ['pdflatex', '-ini', f'-jobname={name}', *self.options,
+                    '&pdflatex', src_path]
+            try:
+                p = subprocess.Popen(args,
+                                     cwd=tmp_dir,
+                                     stdout=subprocess.PIPE,
+                                     stderr=subprocess.PIPE)
+            except FileNotFoundError:
+                raise LatexError('Latex compiler pdflatex not found.')
+            stdout, stderr = p.communicate()
+            out_path = os.path.join(tmp_dir, f'{name}.fmt')
+            if p.returncode != 0 or not os.path.exists(out_path):
+                # pdflatex had an error
+                msg = ''
+                if stdout:
+                    msg += stdout.decode()
+                if stderr:
+                    msg += stderr.decode()
+                raise LatexError(msg)
+            # Atomic so concurrent processes and threads never see a partial
+            # format
+            fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.cache_dir)
+            os.close(fd)
+            try:
+                shutil.copyfile(out_path, tmp_path)
+                os.replace(tmp_path, fmt_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
@@ -0,0 +1,288 @@
+import atexit
+import collections
+import os
+import select
+import subprocess
+import tempfile
+import threading
+import time
+
+from .project import LatexError
+
+
+# Command line options -> shell mode actions (None to ignore)
+_OPTION_ACTIONS = {
+    '-z': None,
+    '--without-gui': None,
+    '-C': 'export-area-page',
+    '-D': 'export-area-drawing',
+}
+
+_default_pool = None
+_default_lock = threading.Lock()
+_use_default_pool = True
+
+
+def inkscape_actions(options):
+    '''
+    Returns the shell mode actions equivalent to inkscape command line export
+    options or None if an option has no equivalent.
+
+    Short options -C and -D and long options --export-name[=value] are
+    supported.  The export file name is given separately.
+    '''
+    actions = []
+    for opt in options:
+        if opt in _OPTION_ACTIONS:
+            action = _OPTION_ACTIONS[opt]
+            if action is not None:
+                actions.append(action)
+        elif (opt.startswith('--export-')
+                and not opt.startswith('--export-filename')):
+            name, sep, value = opt[2:].partition('=')
+            if ';' in value or '\n' in value:
+                return None
+            actions.append(f'{name}:{value}' if sep else name)
+        else:
+            return None
+    return tuple(actions)
+
+def get_inkscape_pool():
+    '''
+    Returns the InkscapePool used by `svg_to_pdf` and `render_svg` or None
+    if a new inkscape process is started for each SVG.
+    '''
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None and _use_default_pool:
+            _default_pool = InkscapePool()
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+def set_inkscape_pool(pool):
+    '''
+    Sets the InkscapePool used by `svg_to_pdf` and `render_svg`.
+
+    Args:
+        pool: An InkscapePool or None to start a new inkscape process for
+            each SVG.  The previous pool is not closed.
+    '''
+    global _default_pool, _use_default_pool
+    with _default_lock:
+        _default_pool = pool
+        _use_default_pool = pool is not None
+
+
+class _WorkerExited(Exception):
+    pass
+
+
+class _InkscapeWorker:
+    def __init__(self, inkscape, timeout):
+        '''
+        An `inkscape --shell` process that runs one line of actions at a time
+        and prints a prompt when it is ready for the next.
+        '''
+        # A file instead of a pipe so warnings never block the process
+        self.err_file = tempfile.TemporaryFile()
+        try:
+            self.p = subprocess.Popen([inkscape, '--shell'],
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=self.err_file)
+        except FileNotFoundError:
+            self.err_file.close()
+            raise LatexError(f'{inkscape} command not found.')
+        self.jobs = 0
+        try:
+            self._read_prompt(timeout)
+        except BaseException:
+            self.close()
+            raise
+
+    def is_alive(self):
+        return self.p.poll() is None
+
+    def _read_prompt(self, timeout):
+        '''Returns the output up to the next prompt.'''
+        fd = self.p.stdout.fileno()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        out = b''
+        while not (out == b'> ' or out.endswith(b'\n> ')):
+            remaining = (None if deadline is None
+                         else max(0, deadline - time.monotonic()))
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                self.p.kill()
+                raise LatexError('inkscape timed out.')
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                raise _WorkerExited(self._errors(0))
+            out += chunk
+        return out[:-2]
+
+    def _errors(self, start):
+        self.err_file.seek(start)
+        msg = self.err_file.read().decode(errors='replace')
+        self.err_file.seek(0, os.SEEK_END)
+        return msg
+
+    def run(self, actions, svg_path, out_path, timeout):
+        '''
+        Runs one export and returns an error message if it produced no
+        output or None on success.  The worker is ready for the next job only
+        if this returns.
+        '''
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        line = ';'.join([f'file-open:{svg_path}',
+                         *actions,
+                         f'export-filename:{out_path}',
+                         'export-do',
+                         'file-close'])
+        err_start = self.err_file.seek(0, os.SEEK_END)
+        try:
+            self.p.stdin.write(line.encode() + b'\n')
+            self.p.stdin.flush()
+        except BrokenPipeError:
+            raise _WorkerExited(self._errors(0))
+        out = self._read_prompt(timeout)
+        self.jobs += 1
+        if not os.path.exists(out_path):
+            # The shell keeps running after a failed action
+            return out.decode(errors='replace') + self._errors(err_start)
+        return None
+
+    def close(self):
+        try:
+            if self.p.poll() is None:
+                self.p.stdin.write(b'quit\n')
+            self.p.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self.p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.p.kill()
+            self.p.wait()
+        self.p.stdout.close()
+        self.err_file.close()
+
+
+class InkscapePool:
+    def __init__(self, size=2, max_jobs=100, timeout=60):
+        '''
+        A pool of long running `inkscape --shell` processes for converting
+        many SVGs without paying the Inkscape startup time for each.
+
+        Workers are started on demand and reused for later jobs with the same
+        export actions (export options persist within a shell session).  A
+        worker is replaced after max_jobs jobs, to bound memory growth, or
+        when it exits unexpectedly.  Requires Inkscape 1.x.
+
+        Args:
+            size: The maximum number of concurrent jobs and of idle workers
+                kept running.
+            max_jobs: The number of jobs a worker runs before it is
+                restarted.
+            timeout: The maximum number of seconds a job may run.
+        '''
+        self.size = size
+        self.max_jobs = max_jobs
+        self.timeout = timeout
+        self._idle = collections.OrderedDict()  # Key -> workers
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(size)
+
+    def _take(self, key):
+        '''Returns a live idle worker, starting one if none is idle.'''
+        dead = []
+        worker = None
+        with self._lock:
+            workers = self._idle.get(key, [])
+            while workers:
+                w = workers.pop()
+                if w.is_alive():
+                    worker = w
+                    break
+                dead.append(w)
+            if not workers:
+                self._idle.pop(key, None)
+        for w in dead:
+            w.close()
+        if worker is None:
+            worker = _InkscapeWorker(key[0], self.timeout)
+        return worker
+
+    def _give_back(self, key, worker):
+        if worker.jobs >= self.max_jobs or not worker.is_alive():
+            worker.close()
+            return
+        with self._lock:
+            self._idle.setdefault(key, []).append(worker)
+            self._idle.move_to_end(key)
+            extra = []
+            count = sum(map(len, self._idle.values()))
+            while count > self.size:
+                oldest = next(iter(self._idle))
+                workers = self._idle[oldest]
+                extra.append(workers.pop(0))
+                if not workers:
+                    del self._idle[oldest]
+                count -= 1
+        for w in extra:
+            w.close()
+
+    def export(self, svg_path, out_path, actions, inkscape='inkscape'):
+        '''
+        Exports an SVG file with the given shell mode actions.
+
+        Use `inkscape_actions` to convert command line options.  A job that
+        crashes its worker is retried once with a new worker.
+
+        Args:
+            svg_path: The input SVG file.
+            out_path: The output file.  Its extension selects the export
+                type unless an export-type action is given.
+            actions: A sequence of actions like 'export-area-page'.
+            inkscape: The inkscape executable.
+        '''
+        svg_path = os.path.abspath(svg_path)
+        out_path = os.path.abspath(out_path)
+        if any(c in path for path in (svg_path, out_path) for c in ';\n'):
+            raise ValueError('Paths used with an InkscapePool may not '
+                             'contain ";" or newlines.')
+        key = inkscape, tuple(actions)
+        with self._slots:
+            for attempt in range(2):
+                worker = self._take(key)
+                try:
+                    error = worker.run(key[1], svg_path, out_path,
+                                       self.timeout)
+                except _WorkerExited as e:
+                    worker.close()
+                    if attempt > 0:
+                        raise LatexError(f'inkscape exited unexpectedly.\n'
+                                         f'{e}')
+                    continue
+                except BaseException:
+                    # The worker may be mid-job so it can't be reused
+                    worker.close()
+                    raise
+                self._give_back(key, worker)
+                if error is not None:
+                    raise LatexError(error)
+                return
+
+    def close(self):
+        with self._lock:
+            workers = [w for ws in self._idle.values() for w in ws]
+            self._idle.clear()
+        for w in workers:
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -5,16 +5,37 @@ from . import content
 
 @functools.total_ordering
 class LatexPackage:
+    _FIELDS = ('name', 'options', 'setup_content', 'sort_priority',
+               'packages', 'commands')
+    __slots__ = (*_FIELDS, '_frozen', '_key_cache', '_sort_key_cache',
+                 '_hash', '_depth', '__weakref__')
+
     def __init__(self, name, options=(), setup_content=None, sort_priority=0,
                  packages=(), commands=()):
+        '''
+        A package imported in a document preamble.
+
+        Packages are immutable so their key, hash, sort key, and depth are
+        computed at most once.
+        '''
         self.name = name
         self.options = tuple(options)
         if isinstance(setup_content, str):
             setup_content = content.BasicContent(setup_content)
         self.setup_content = setup_content
         self.sort_priority = sort_priority
-        self.packages = list(packages)
-        self.commands = list(commands)
+        self.packages = tuple(packages)
+        self.commands = tuple(commands)
+        self._key_cache = None
+        self._sort_key_cache = None
+        self._hash = None
+        self._depth = None
+        self._frozen = True
+
+    def __setattr__(self, name, value):
+        if name in LatexPackage._FIELDS and getattr(self, '_frozen', False):
+            raise AttributeError(f'LatexPackage is immutable: {name}')
+        super().__setattr__(name, value)
 
     def latex_code_import(self):
         options_str = '' if not self.options else f'[{",".join(self.options)}]'
@@ -38,26 +59,27 @@ class LatexPackage:
             yield from self.setup_content.required_commands()
 
     def require_depth(self):
-        try:
-            next(iter(self.required_packages()))
-        except StopIteration:
-            return 0
-        return 1+max(map(LatexPackage.require_depth, self.required_packages()))
+        if self._depth is None:
+            self._depth = 1 + max(map(LatexPackage.require_depth,
+                                      self.required_packages()),
+                                  default=-1)
+        return self._depth
 
     def _key(self):
-        if self.setup_content is None:
-            content = ''
-        else:
-            content = self.setup_content.latex_code_body()
-        return (-self.sort_priority, self.name, self.options, content)
+        if self._key_cache is None:
+            if self.setup_content is None:
+                content = ''
+            else:
+                content = self.setup_content.latex_code_body()
+            self._key_cache = (-self.sort_priority, self.name, self.options,
+                               content)
+        return self._key_cache
 
     def _sort_key(self):
-        if self.setup_content is None:
-            content = ''
-        else:
-            content = self.setup_content.latex_code_body()
-        return (-self.sort_priority, self.require_depth(), self.name,
-                self.options, content)
+        if self._sort_key_cache is None:
+            key = self._key()
+            self._sort_key_cache = (key[0], self.require_depth(), *key[1:])
+        return self._sort_key_cache
 
     def __lt__(self, other):
         if not isinstance(other, LatexPackage):
@@ -68,19 +90,34 @@ class LatexPackage:
     def __eq__(self, other):
         if not isinstance(other, LatexPackage):
             return NotImplemented
+        elif self is other:
+            return True
         else:
-            return self._key() == other._key()
+            return hash(self) == hash(other) and self._key() == other._key()
 
     def __hash__(self):
-        return hash((LatexPackage, self._key()))
+        if self._hash is None:
+            self._hash = hash((LatexPackage, self._key()))
+        return self._hash
 
     def can_coexist(self, other):
         return self.name != other.name
 
     def can_merge(self, other):
-        return False
+        '''Returns if other is the same package except for its options.'''
+        return (isinstance(other, LatexPackage)
+                and self.name == other.name
+                and self._key()[3] == other._key()[3]
+                and self.sort_priority == other.sort_priority
+                and self.packages == other.packages
+                and self.commands == other.commands)
 
     def merge_packages(self, other):
         if not self.can_merge(other):
             raise ValueError(
                     f'Cannot merge packages: {self.name}, {other.name}')
+        options = tuple(dict.fromkeys((*self.options, *other.options)))
+        return LatexPackage(self.name, options=options,
+                            setup_content=self.setup_content,
+                            sort_priority=self.sort_priority,
+                            packages=self.packages, commands=self.commands)
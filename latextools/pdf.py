@@ -1,4 +1,6 @@
 import base64
+import os
+import shutil
 
 
 class Pdf:
@@ -10,17 +12,73 @@ class Pdf:
         self.height = height
         self.border = border
         self.log = log
+        self._svg = None  # (file key, data, Svg)
 
     def save(self, fname):
+        if self.data is None and self.fname is not None:
+            shutil.copyfile(self.fname, fname)
+            return
         with open(fname, 'wb') as f:
             f.write(self.data)
 
-    def rasterize(self, to_file=None, scale=1):
-        return self.as_svg().rasterize(to_file=to_file, scale=scale)
+    def rasterize(self, to_file=None, scale=1, backend='svg', dpi=None,
+                  pages=None):
+        '''
+        Converts the PDF to an image.
+
+        Args:
+            to_file: An optional file name to save the PNG to.
+            scale: The size relative to 96 dpi, used if dpi is not given.
+            backend: 'svg' converts the first page with pdf2svg and
+                rasterizes it with drawsvg and cairo.  'pdftoppm', 'mupdf',
+                or 'auto' rasterize the PDF directly with
+                `latextools.convert.pdf_to_png` and return a Png.
+            dpi: The resolution.
+            pages: Pages to convert as in `pdf_to_png`.  Not supported by
+                the svg backend.
+        '''
+        if backend == 'svg':
+            if pages is not None:
+                raise ValueError('The svg backend only converts the first '
+                                 'page.')
+            if dpi is not None:
+                scale = dpi / 96
+            return self.as_svg().rasterize(to_file=to_file, scale=scale)
+        from .convert import pdf_to_png
+        if dpi is None:
+            dpi = 96 * scale
+        return pdf_to_png(self, out_name=to_file, pages=pages, dpi=dpi,
+                          backend=backend)
+
+    def as_svg(self, cache=None):
+        '''
+        Converts the first page to an Svg.
+
+        The result is kept for later calls until fname, data, or the file
+        (by modification time and size) changes.
 
-    def as_svg(self):
+        Args:
+            cache: An optional `latextools.RenderCache` to share conversions
+                between processes.
+        '''
+        file_key = self._file_key()
+        memo = self._svg
+        if (memo is not None and memo[0] == file_key
+                and memo[1] is self.data):
+            return memo[2]
         from .convert import pdf_to_svg
-        return pdf_to_svg(self)
+        svg = pdf_to_svg(self, cache=cache)
+        self._svg = file_key, self.data, svg
+        return svg
+
+    def _file_key(self):
+        if self.fname is None:
+            return None
+        try:
+            st = os.stat(self.fname)
+        except OSError:
+            return self.fname, None
+        return self.fname, st.st_mtime_ns, st.st_size
 
     def to_drawables(self, **kwargs):
         '''Integration with drawsvg.
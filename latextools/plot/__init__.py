@@ -1,4 +1,4 @@
 from .artist_wrap import ArtistContent
 
-from .scatter_plot import PgfplotsFigure, Plot, Graph
+from .scatter_plot import PgfplotsFigure, Plot, Graph, PlotDataFile
 from .bar_plot import BarPlot, BarGraph
@@ -69,15 +69,39 @@ coordinates {{
     {data}
 }};{legend}'''
 
+BAR_GRAPH_TABLE_TEMPLATE = r'''\addplot[
+    style={{
+        color=transparent,
+        draw=none,
+        fill={color},
+        {pattern},
+        mark=none,
+        {bar_shift},
+        {extra_config},
+    }},
+    {error_bar_config}]
+table[x={x_col}, y={y_col}{extra_table_opt}, col sep=comma]
+    {{{data_path}}};{legend}'''
+
 
 class BarPlot(Plot):
     def __init__(self, title='', xlabel='', ylabel='', ymin=None, ymax=None,
                  width='\columnwidth', height='0.6\columnwidth',
                  bar_width='15pt', bar_space='5pt', y_tick_suffix=r'',
                  rotate_labels=False, x_sort_key=None, ygrid=False, log=False,
-                 extra_config=r'', extra_graphs=r''):
-        super().__init__(title=title, xlabel=xlabel, ylabel=ylabel, ymin=ymin,
-                         ymax=ymax, width=width, height=height,
+                 extra_config=r'', extra_graphs=r'', external_data=False,
+                 fname_prefix=''):
+        '''
+        A pgfplots bar chart with symbolic x coordinates.
+
+        Args:
+            external_data: If true, bar data is written to an external CSV
+                file like Plot instead of inline coordinates, which keeps the
+                TeX source small for many categories.
+        '''
+        super().__init__(fname_prefix=fname_prefix, title=title,
+                         xlabel=xlabel, ylabel=ylabel, ymin=ymin, ymax=ymax,
+                         width=width, height=height,
                          extra_config=extra_config, extra_graphs=extra_graphs)
         self.bar_width = bar_width
         self.bar_space = bar_space
@@ -86,22 +110,32 @@ class BarPlot(Plot):
         self.x_sort_key = x_sort_key
         self.ygrid = ygrid
         self.log = log
+        self.external_data = external_data
 
     def bar(self, x_data, y_data, fmt='', **kwargs):
         return super().plot(x_data, y_data, fmt=fmt, **kwargs)
 
     def get_data_path(self):
-        return None
+        if not self.external_data:
+            return None
+        return super().get_data_path()
 
-    def _latex_code_body(self, indent='', i=0):
-        axis = 'semilogyaxis' if self.log else 'axis'
-        all_x_data = list(self.graph_list[0].x_data)
+    def _all_x_data(self):
+        '''Returns every x category of all graphs in order.'''
+        all_x_data = dict.fromkeys(self.graph_list[0].x_data)
         for graph in self.graph_list[1:]:
-            for x in graph.x_data:
-                if x not in all_x_data:
-                    all_x_data.append(x)
+            all_x_data.update(dict.fromkeys(graph.x_data))
+        all_x_data = list(all_x_data)
         if self.x_sort_key is not None:
             all_x_data = sorted(all_x_data, key=self.x_sort_key)
+        return all_x_data
+
+    def _get_x_col(self, i, g):
+        return clean_string(self.xlabel) or 'x'
+
+    def _latex_code_body(self, indent='', i=0):
+        axis = 'semilogyaxis' if self.log else 'axis'
+        all_x_data = self._all_x_data()
         x_coords = ','.join(map(escape_latex,
                                 map(str, all_x_data)))
         enlargelimits = (1 if len(all_x_data) <= 1
@@ -112,10 +146,15 @@ class BarPlot(Plot):
             ymax *= 1.3
         else:
             ymax = self.ymax
+        data_path = self.get_data_path()
         graphs_str = '\n\n'.join(g._latex_code_body(
                                     indent=INDENT_STEP,
+                                    x_col=self._get_x_col(i, g),
+                                    y_col=self._get_y_col(i, g),
+                                    x_err_col=self._get_x_err_col(i, g),
+                                    y_err_col=self._get_y_err_col(i, g),
+                                    data_path=data_path,
                                     last=i >= len(self.graph_list)-1,
-                                    all_x_data=all_x_data,
                                     x_sort_key=self.x_sort_key)
                                  for i, g in enumerate(self.graph_list))
         if self.rotate_labels:
@@ -151,7 +190,27 @@ class BarPlot(Plot):
         return str_util.prefix_lines(indent, out)
 
     def get_required_files(self):
-        return ()
+        if not self.external_data:
+            return ()
+        return super().get_required_files()
+
+    def _data_columns(self):
+        all_x_data = self._all_x_data()
+        column_names = [self._get_x_col(0, None)]
+        columns = [[escape_latex(str(x)) for x in all_x_data]]
+        for i, g in enumerate(self.graph_list):
+            for name, data in ((self._get_x_err_col(i, g), g.x_error),
+                               (self._get_y_col(i, g), g.y_data),
+                               (self._get_y_err_col(i, g), g.y_error)):
+                if data is None:
+                    continue
+                value_map = dict(zip(g.x_data, data))
+                # pgfplots discards nan points so missing bars are not drawn
+                missing = 'nan' if data is g.y_data else 0
+                column_names.append(name)
+                columns.append([value_map.get(x, missing)
+                                for x in all_x_data])
+        return column_names, columns
 
     def write_data(self):
         return
@@ -170,21 +229,19 @@ class BarGraph(Graph):
 
     def _latex_code_body(self, indent='', x_col=None, y_col=None,
                          x_err_col=None, y_err_col=None,
-                         data_path=None, last=False, all_x_data=(),
-                         x_sort_key=None):
+                         data_path=None, last=False, x_sort_key=None):
         x_data = list(self.x_data)
         y_data = list(self.y_data)
         x_error = ([0]*len(x_data) if self.x_error is None
                                    else list(self.x_error))
         y_error = ([0]*len(y_data) if self.y_error is None
                                    else list(self.y_error))
-        for x in all_x_data:
-            if x not in x_data:
-                x_data.append(x)
-                y_data.append(0)
-        if x_sort_key is not None:
-            x_data, y_data = zip(*sorted(zip(x_data, y_data),
-                                 key=lambda xy:x_sort_key(xy[0])))
+        # Categories missing from this graph are placed by the symbolic x
+        # coords of the plot so only this graph's bars are emitted
+        if data_path is None and x_sort_key is not None:
+            x_data, y_data, x_error, y_error = zip(*sorted(
+                    zip(x_data, y_data, x_error, y_error),
+                    key=lambda row:x_sort_key(row[0])))
         if self.legend is not None:
             legend = escape_latex(self.legend) + '~~~~'*(not last)
             legend_str = '\n' fr'\addlegendentry{{{legend}}};'
@@ -199,12 +256,27 @@ class BarGraph(Graph):
         else:
             pattern_str = ''
         error_bar_config = ''
+        extra_table_opt = ''
         if self.x_error is not None or self.y_error is not None:
             error_bar_config += 'error bars/.cd'
             if self.x_error is not None:
                 error_bar_config += ',x dir=both,x explicit'
+                extra_table_opt += f', x error={x_err_col}'
             if self.y_error is not None:
                 error_bar_config += ',y dir=both,y explicit'
+                extra_table_opt += f', y error={y_err_col}'
+        if data_path is not None:
+            out = BAR_GRAPH_TABLE_TEMPLATE.format(
+                    legend=legend_str,
+                    color=self.color,
+                    pattern=pattern_str,
+                    bar_shift=bar_shift_str,
+                    extra_config=self.extra_config,
+                    error_bar_config=error_bar_config,
+                    x_col=x_col, y_col=y_col,
+                    extra_table_opt=extra_table_opt,
+                    data_path=data_path)
+            return str_util.prefix_lines(indent, out)
         data_str = '\n    '.join(
                 f'({escape_latex(str(x))}, {y})'
                 + (f' +- ({xe}, {ye})' if error_bar_config else '')
@@ -0,0 +1,107 @@
+import re
+
+
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+# Approximate widths of the usual pgfplots width macros
+_LENGTH_MACROS_PT = {
+    'columnwidth': 345,
+    'linewidth': 345,
+    'textwidth': 345,
+    'hsize': 345,
+}
+_UNITS_PT = {
+    'pt': 1,
+    'bp': 72.27/72,
+    'in': 72.27,
+    'cm': 72.27/2.54,
+    'mm': 72.27/25.4,
+    'em': 10,
+    'ex': 4.3,
+}
+_LENGTH_RE = re.compile(r'^\s*([0-9.]*)\s*\\?([a-z]+)\s*$')
+
+
+def length_to_pt(length, default=345):
+    '''
+    Approximates a TeX length like '8cm' or '0.5\\columnwidth' in points.
+    '''
+    m = _LENGTH_RE.match(str(length))
+    if m is None:
+        return default
+    factor = float(m.group(1)) if m.group(1) else 1
+    unit = m.group(2)
+    if unit in _UNITS_PT:
+        return factor * _UNITS_PT[unit]
+    return factor * _LENGTH_MACROS_PT.get(unit, default)
+
+def default_max_points(width):
+    '''
+    Returns a point count that is indistinguishable from the full data for a
+    plot of the given width (two points per half point of width).
+    '''
+    return max(16, int(4 * length_to_pt(width)))
+
+def downsample_indices(method, x, y, max_points):
+    '''
+    Returns a sorted NumPy array of the indices of points to keep.
+
+    Points are bucketed by index so x should be sorted.
+
+    Args:
+        method: 'lttb' (largest triangle three buckets) or 'minmax' (the
+            first, last, minimum, and maximum of each bucket).
+        x: The x values.
+        y: The y values.
+        max_points: The maximum number of points to keep, at least 3.
+    '''
+    if max_points < 3:
+        raise ValueError(f'max_points must be at least 3, got {max_points}')
+    import numpy as np
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    if method == 'lttb':
+        return _lttb_indices(np.asarray(x, dtype=float),
+                             np.asarray(y, dtype=float), max_points)
+    elif method == 'minmax':
+        return _minmax_indices(np.asarray(y, dtype=float), max_points)
+    raise ValueError(f'Unknown downsample method: {method!r}, expected one '
+                     f'of {DOWNSAMPLE_METHODS}')
+
+def _lttb_indices(x, y, max_points):
+    import numpy as np
+    n = len(y)
+    num_buckets = max_points - 2
+    edges = np.linspace(1, n-1, num_buckets+1).astype(int)
+    out = np.empty(max_points, dtype=int)
+    out[0] = 0
+    out[-1] = n - 1
+    prev = 0
+    for i in range(num_buckets):
+        start, stop = edges[i], edges[i+1]
+        if i + 1 < num_buckets:
+            next_x = x[edges[i+1]:edges[i+2]].mean()
+            next_y = y[edges[i+1]:edges[i+2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        # Twice the area of the triangle with the previous point and the mean
+        # of the next bucket
+        area = np.abs((x[prev] - next_x) * (y[start:stop] - y[prev])
+                      - (x[prev] - x[start:stop]) * (next_y - y[prev]))
+        prev = start + int(np.argmax(area))
+        out[i+1] = prev
+    return out
+
+def _minmax_indices(y, max_points):
+    import numpy as np
+    n = len(y)
+    num_buckets = max(1, max_points // 4)
+    edges = np.linspace(0, n, num_buckets+1).astype(int)
+    idx = [edges[:-1], edges[1:]-1]
+    starts = edges[:-1]
+    idx.append(starts + np.array([np.argmin(y[a:b])
+                                  for a, b in zip(starts, edges[1:])]))
+    idx.append(starts + np.array([np.argmax(y[a:b])
+                                  for a, b in zip(starts, edges[1:])]))
+    return np.unique(np.concatenate(idx))
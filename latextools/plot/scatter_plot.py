@@ -1,11 +1,13 @@
+import io
 import string
 
 from .. import str_util
+from . import downsample
 from .. import (
     LatexPackage,
     CommandBundle,
     LatexContentAbc,
-    PlainTextFile,
+    FileAbc,
     INDENT_STEP,
 )
 
@@ -74,7 +76,103 @@ def escape_latex(s):
     return s.replace('_', r'\_')
 
 
+def _take(data, idx):
+    if idx is None:
+        return data
+    import numpy as np
+    return np.asarray(data)[idx]
+
+def _same_data(a, b):
+    '''
+    Returns if two lists or NumPy arrays hold equal data without comparing
+    element by element in Python.
+    '''
+    if a is b:
+        return True
+    if len(a) != len(b):
+        return False
+    if hasattr(a, 'dtype') or hasattr(b, 'dtype'):
+        import numpy as np
+        return np.array_equal(a, b)
+    return a == b
+
+
+class PlotDataFile(FileAbc):
+    chunk_rows = 2**14
+    # None writes floats with str(), which is lossless and matches lists
+    default_float_format = None
+
+    def __init__(self, path, column_names, columns, data_format=None):
+        '''
+        A CSV table of plot data that is formatted while it is written.
+
+        Rows are formatted in chunks with one string formatting operation per
+        column instead of one per cell.
+
+        Args:
+            column_names: The header of each column.
+            columns: Lists or NumPy arrays.  Shorter columns are padded with
+                empty cells.
+            data_format: A printf-style format for numbers, e.g. '%.4g'.  By
+                default, values are written with str() (NumPy integer arrays
+                with '%d') so the same data is written the same way whether
+                it is in a list or an array.  Values are also written with
+                str() if data_format cannot format them (e.g. NaN with
+                '%d').
+        '''
+        super().__init__(path)
+        self.column_names = column_names
+        self.columns = columns
+        self.data_format = data_format
+
+    def is_text(self):
+        return True
+
+    def get_content(self):
+        f = io.StringIO()
+        self.write_content(f)
+        return f.getvalue()
+
+    def write_content(self, f):
+        f.write(','.join(self.column_names))
+        f.write('\n')
+        num_rows = max(map(len, self.columns), default=0)
+        for start in range(0, num_rows, self.chunk_rows):
+            stop = min(start + self.chunk_rows, num_rows)
+            cells = [self._format_cells(col, start, stop)
+                     for col in self.columns]
+            f.write(''.join([','.join(row) + '\n' for row in zip(*cells)]))
+
+    def _column_format(self, col):
+        kind = getattr(getattr(col, 'dtype', None), 'kind', None)
+        if kind in ('i', 'u'):
+            return self.data_format or '%d'
+        elif kind == 'f':
+            return self.data_format or self.default_float_format
+        return self.data_format
+
+    def _format_cells(self, col, start, stop):
+        part = col[start:stop]
+        fmt = self._column_format(col)
+        if hasattr(part, 'tolist'):
+            part = part.tolist()
+        cells = None
+        if fmt is not None and part:
+            try:
+                cells = ('\n'.join([fmt]*len(part)) % tuple(part)
+                        ).split('\n')
+            except (TypeError, ValueError):
+                # Not all numbers or not representable with fmt
+                pass
+        if cells is None:
+            cells = list(map(str, part))
+        cells.extend([''] * (stop - start - len(cells)))
+        return cells
+
+
 class PgfplotsFigure(LatexContentAbc):
+    _OBSERVED_LISTS = LatexContentAbc._OBSERVED_LISTS + ('plot_list',)
+
     def __init__(self, scale=1):
         super().__init__([], [plot_deps], 'Pgfplots figure')
         self.scale = scale
@@ -89,6 +187,9 @@ class PgfplotsFigure(LatexContentAbc):
         return plot
 
     def _latex_code_body(self, indent=''):
+        for p in self.plot_list:
+            # Bypasses the cache of each plot so register its graphs here
+            p._register_sub_content()
         plots_str = '\n\n'.join(p._latex_code_body(
                                     indent=INDENT_STEP, i=i)
                                 for i, p in enumerate(self.plot_list))
@@ -101,6 +202,8 @@ class PgfplotsFigure(LatexContentAbc):
 
 class Plot(LatexContentAbc):
     GRAPH_TYPE = None
+    _OBSERVED_LISTS = LatexContentAbc._OBSERVED_LISTS + ('graph_list',)
+    _UNCACHED_ATTRS = ('data_file', 'downsample_ratio')
 
     def __init__(self, title='', xlabel='', ylabel='', ymin=None, ymax=None,
                  xmin=None, xmax=None, fname_prefix='',
@@ -108,7 +211,21 @@ class Plot(LatexContentAbc):
                  hide_box=False, hide_x_tick_labels=False,
                  hide_y_tick_labels=False, legend_pos='top-left',
                  legend_at=None, legend_horizontal=False, axis='axis',
-                 extra_config=r'', extra_graphs=r''):
+                 extra_config=r'', extra_graphs=r'', data_format=None,
+                 downsample=None, max_points=None):
+        '''
+        A pgfplots axis whose data is written to an external CSV file.
+
+        Args:
+            data_format: A printf-style format for numbers in the data file,
+                e.g. '%.4g'.
+            downsample: None to keep all points, 'lttb', or 'minmax' to reduce
+                dense series before writing the data file.  Graphs may
+                override this.  After the data file is generated, the
+                fraction of points kept is stored in downsample_ratio.
+            max_points: The number of points to keep per series when
+                downsampling.  Defaults to a count based on the plot width.
+        '''
         super().__init__([], [plot_deps], 'Pgfplots plot')
         self.title = title
         self.xlabel = xlabel
@@ -131,10 +248,21 @@ class Plot(LatexContentAbc):
         self.axis = axis
         self.extra_config = extra_config
         self.extra_graphs = extra_graphs
+        self.data_format = data_format
+        self.downsample = downsample
+        self.max_points = max_points
+        self.downsample_ratio = None
 
     def append_graph(self, graph):
         self.graph_list.append(graph)
 
+    def list_sub_content(self):
+        return self.graph_list
+
+    def _clear_cache(self):
+        super()._clear_cache()
+        self.data_file = None
+
     def plot(self, x_data, y_data, fmt='', x_error=None, y_error=None,
              **kwargs):
         graph = self.GRAPH_TYPE(x_data, y_data, fmt=fmt, x_error=x_error,
@@ -182,7 +310,7 @@ class Plot(LatexContentAbc):
                 .strip())
 
     def _is_x_common(self):
-        return all(self.graph_list[0].x_data == g.x_data
+        return all(_same_data(self.graph_list[0].x_data, g.x_data)
                    for g in self.graph_list)
 
     def _latex_code_body(self, indent='', i=0):
@@ -278,50 +406,93 @@ class Plot(LatexContentAbc):
 
     def get_required_files(self):
         if self.data_file is None:
+            self._register_sub_content()
             self._init_data_file()
         return [self.data_file]
 
     def _init_data_file(self):
-        file_content = self._data_file_content()
-        self.data_file = PlainTextFile(self.get_data_path(), file_content)
+        column_names, columns = self._data_columns()
+        self.data_file = PlotDataFile(self.get_data_path(), column_names,
+                                      columns, data_format=self.data_format)
 
     def _data_file_content(self):
+        column_names, columns = self._data_columns()
+        return PlotDataFile(self.get_data_path(), column_names, columns,
+                            data_format=self.data_format).get_content()
+
+    def _data_columns(self):
         column_names = []
         columns = []
 
         is_x_common = self._is_x_common()
+        index_list = self._downsample_indices(is_x_common)
         if is_x_common:
-            common_x_data = self.graph_list[0].x_data
+            common_x_data = _take(self.graph_list[0].x_data, index_list[0])
             column_names.append(clean_string(self.xlabel) or 'x')
             columns.append(common_x_data)
 
-        for i, g in enumerate(self.graph_list):
+        for i, (g, idx) in enumerate(zip(self.graph_list, index_list)):
             if not is_x_common:
                 column_names.append(self._get_x_col(i, g))
-                columns.append(g.x_data)
+                columns.append(_take(g.x_data, idx))
             if g.x_error is not None:
                 column_names.append(self._get_x_err_col(i, g))
-                columns.append(g.x_error)
+                columns.append(_take(g.x_error, idx))
             column_names.append(self._get_y_col(i, g))
-            columns.append(g.y_data)
+            columns.append(_take(g.y_data, idx))
             if g.y_error is not None:
                 column_names.append(self._get_y_err_col(i, g))
-                columns.append(g.y_error)
-
-        out = ''
-        out += ','.join(column_names)
-        out += '\n'
-        for row_i in range(max(map(len, columns))):
-            out += ','.join(str(col[row_i]) if row_i < len(col) else ''
-                                            for col in columns)
-            out += '\n'
-        return out
+                columns.append(_take(g.y_error, idx))
+        return column_names, columns
+
+    def _downsample_indices(self, is_x_common):
+        '''
+        Returns the indices of the points to keep for each graph (None to
+        keep all) and sets downsample_ratio.
+        '''
+        max_points = self.max_points
+        if max_points is None:
+            max_points = downsample.default_max_points(self.width)
+        index_list = []
+        for g in self.graph_list:
+            method = self.downsample if g.downsample is None else g.downsample
+            if method and len(g.y_data) > max_points:
+                index_list.append(downsample.downsample_indices(
+                        method, g.x_data, g.y_data, max_points))
+            else:
+                index_list.append(None)
+        if all(idx is None for idx in index_list):
+            self.downsample_ratio = None
+            return index_list
+        orig_len = sum(len(g.y_data) for g in self.graph_list)
+        if is_x_common:
+            # Keep the union so every series still shares the x column
+            import numpy as np
+            n = len(self.graph_list[0].x_data)
+            idx = np.unique(np.concatenate([
+                    np.arange(n) if idx is None else idx
+                    for idx in index_list]))
+            index_list = [idx] * len(index_list)
+        new_len = sum(len(g.y_data) if idx is None else len(idx)
+                      for g, idx in zip(self.graph_list, index_list))
+        self.downsample_ratio = new_len / orig_len
+        return index_list
 
 
 class Graph(LatexContentAbc):
     def __init__(self, x_data, y_data, fmt='', x_error=None, y_error=None,
                  legend='', color='black', extra_error_bar_options='',
-                 **kwargs):
+                 downsample=None, **kwargs):
+        '''
+        A series of a Plot.
+
+        The data and error columns may be lists or NumPy arrays.  Arrays are
+        stored as given, without copying.
+
+        Args:
+            downsample: Overrides the downsample method of the plot.  False
+                keeps all points.
+        '''
         super().__init__([], [plot_deps], 'Pgfplots graph')
         self.x_data = x_data
         self.y_data = y_data
@@ -331,6 +502,7 @@ class Graph(LatexContentAbc):
         self.legend = legend
         self.color = color
         self.extra_error_bar_options = extra_error_bar_options
+        self.downsample = downsample
 
     def _latex_code_body(self, indent='', x_col='x', y_col='y',
                          x_err_col='x-err', y_err_col='y-err',
@@ -0,0 +1,217 @@
+import collections
+import os
+import subprocess
+import tempfile
+import threading
+
+import fs
+
+from .pdf import Pdf
+from .project import LatexProject, LatexError
+
+
+_DRIVER_BODY = r'''\begin{document}
+\endlinechar=-1 \read16 to \latextoolsjob \endlinechar=13
+\input{\latextoolsjob}
+\end{document}
+'''
+
+
+class _Worker:
+    def __init__(self, doc, fmt_cache, options):
+        '''
+        A pdflatex process started ahead of time that has loaded the preamble
+        of doc and is blocked reading the name of the job file from stdin.
+        '''
+        self.doc = doc
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = self.tmp_dir.name
+        if fmt_cache is None:
+            header = doc.get_document_class() + '\n\n' + doc.get_preamble()
+        else:
+            fmt_path = fmt_cache.get_format(doc)
+            fmt_fname = os.path.basename(fmt_path)
+            os.symlink(fmt_path, os.path.join(self.cwd, fmt_fname))
+            header = f'%&{fmt_fname[:-4]}'
+        with open(os.path.join(self.cwd, 'main.tex'), 'w') as f:
+            f.write(header)
+            f.write('\n\n')
+            f.write(_DRIVER_BODY)
+        # A file instead of a pipe so an idle worker never blocks on output
+        self.out_path = os.path.join(self.cwd, 'stdout.txt')
+        try:
+            with open(self.out_path, 'wb') as out:
+                self.p = subprocess.Popen(['pdflatex', *options, 'main.tex'],
+                                          cwd=self.cwd,
+                                          stdin=subprocess.PIPE,
+                                          stdout=out,
+                                          stderr=subprocess.STDOUT)
+        except FileNotFoundError:
+            self.tmp_dir.cleanup()
+            raise LatexError('Latex compiler pdflatex not found.')
+
+    def is_alive(self):
+        return self.p.poll() is None
+
+    def run(self, doc, timeout=None, **pdf_args):
+        proj = LatexProject(fs.open_fs(self.cwd))
+        for f in doc.get_required_files():
+            proj.add_file(f)
+        body = '\n\n'.join(filter(bool, (c.latex_code_body(indent='')
+                                         for c in doc.contents)))
+        proj.add_file('job.tex', text=body + '\n')
+        try:
+            self.p.communicate(b'job.tex\n', timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.p.kill()
+            self.p.communicate()
+            raise LatexError('pdflatex timed out.')
+        except BrokenPipeError:
+            # Exited before reading the job, e.g. from a preamble error
+            self.p.wait()
+        if self.p.returncode != 0:
+            # pdflatex had an error
+            with open(self.out_path, 'rb') as f:
+                raise LatexError(f.read().decode(errors='replace'))
+        log = None
+        log_path = os.path.join(self.cwd, 'main.log')
+        if os.path.exists(log_path):
+            with open(log_path, 'r') as f:
+                log = f.read()
+        data = None
+        pdf_path = os.path.join(self.cwd, 'main.pdf')
+        if os.path.exists(pdf_path):
+            with open(pdf_path, 'rb') as f:
+                data = f.read()
+        return Pdf(data=data, log=log, **pdf_args)
+
+    def close(self):
+        if self.p.poll() is None:
+            self.p.kill()
+        self.p.communicate()
+        self.tmp_dir.cleanup()
+
+
+class PdflatexPool:
+    def __init__(self, size=2, max_queue=16, fmt_cache=None, timeout=60,
+                 options=('-halt-on-error', '-file-line-error',
+                          '-interaction', 'scrollmode', '-shell-escape')):
+        '''
+        A pool of warm pdflatex processes for low latency snippet rendering.
+
+        Each worker is started in advance with a document preamble already
+        loaded and waits for a job on stdin.  A worker produces one PDF and
+        exits, and a replacement for the same preamble is started as soon as
+        a worker is taken so process start, format load, and preamble loading
+        are off the critical path.
+
+        Args:
+            size: The maximum number of concurrent jobs and of idle workers
+                kept warm.
+            max_queue: The maximum number of jobs waiting for a free slot.
+                Further jobs raise LatexError.
+            fmt_cache: An optional `latextools.FormatCache` used to start
+                workers from a precompiled preamble format.
+            timeout: The maximum number of seconds a job may run.
+            options: pdflatex options.  The interaction mode must allow
+                reading from the terminal (not nonstopmode or batchmode).
+        '''
+        self.size = size
+        self.max_queue = max_queue
+        self.fmt_cache = fmt_cache
+        self.timeout = timeout
+        self.options = tuple(options)
+        self._idle = collections.OrderedDict()  # Preamble key -> workers
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(size)
+        self._pending = 0
+
+    @staticmethod
+    def _key(doc):
+        return doc.get_document_class(), doc.get_preamble()
+
+    def _spawn(self, key, doc):
+        worker = _Worker(doc, self.fmt_cache, self.options)
+        with self._lock:
+            self._idle.setdefault(key, []).append(worker)
+            self._idle.move_to_end(key)
+            extra = self._trim_idle()
+        for w in extra:
+            w.close()
+
+    def _trim_idle(self):
+        '''Removes the least recently used idle workers beyond size.'''
+        extra = []
+        count = sum(map(len, self._idle.values()))
+        while count > self.size:
+            key = next(iter(self._idle))
+            workers = self._idle[key]
+            extra.append(workers.pop(0))
+            if not workers:
+                del self._idle[key]
+            count -= 1
+        return extra
+
+    def _take(self, key, doc):
+        '''Returns a healthy warm worker, starting one if none is idle.'''
+        dead = []
+        worker = None
+        with self._lock:
+            workers = self._idle.get(key, [])
+            while workers:
+                w = workers.pop(0)
+                if w.is_alive():
+                    worker = w
+                    break
+                dead.append(w)
+            if not workers:
+                self._idle.pop(key, None)
+        for w in dead:
+            w.close()
+        if worker is None:
+            worker = _Worker(doc, self.fmt_cache, self.options)
+        # Warm a replacement while this job runs
+        self._spawn(key, doc)
+        return worker
+
+    def render(self, doc, **pdf_args):
+        '''Compiles a LatexDocument and returns a Pdf.'''
+        with self._lock:
+            if self._pending >= self.size + self.max_queue:
+                raise LatexError('Render pool queue is full.')
+            self._pending += 1
+        try:
+            with self._slots:
+                worker = self._take(self._key(doc), doc)
+                try:
+                    return worker.run(doc, timeout=self.timeout, **pdf_args)
+                finally:
+                    worker.close()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def check_health(self):
+        '''Replaces idle workers that have exited unexpectedly.'''
+        with self._lock:
+            dead = [(key, w) for key, workers in self._idle.items()
+                             for w in workers if not w.is_alive()]
+            for key, w in dead:
+                self._idle[key].remove(w)
+        for key, w in dead:
+            w.close()
+            self._spawn(key, w.doc)
+        return len(dead)
+
+    def close(self):
+        with self._lock:
+            workers = [w for ws in self._idle.values() for w in ws]
+            self._idle.clear()
+        for w in workers:
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,3 +1,9 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import json
+import os
+import re
 import tempfile
 import subprocess
 
@@ -5,20 +11,77 @@ import fs.memoryfs
 
 from .pdf import Pdf
 from .file import FileAbc
+from . import cache as cache_module, async_util
+
+
+PDFLATEX_OPTIONS = ('-halt-on-error', '-file-line-error',
+                    '-interaction', 'nonstopmode')
 
 
 class LatexError(RuntimeError): pass
 
 
 class LatexProject:
-    def __init__(self, proj_fs=None):
+    BUILD_STATE_FNAME = '.latextools-build.json'
+    AUX_EXTENSIONS = ('aux', 'toc', 'lof', 'lot', 'out', 'nav', 'snm', 'bbl')
+
+    def __init__(self, proj_fs=None, cache=None, build_dir=None,
+                 max_passes=1, in_place=False, format_dir=None):
+        '''
+        Args:
+            proj_fs: The pyfilesystem holding the project sources.  Defaults to
+                a new in-memory filesystem.
+            cache: An optional `latextools.cache.RenderCache`.  When set,
+                compiled PDFs are looked up by a digest of the sources and
+                options before running pdflatex.
+            build_dir: An optional persistent directory to compile in.  Only
+                files that changed since the last build are rewritten,
+                files removed from the project are deleted, aux files are
+                kept between builds, and compiling is skipped when no source
+                or option changed.  Cannot be combined with cache.
+            max_passes: The maximum number of pdflatex passes per file.  If
+                greater than one, pdflatex is rerun until cross-references
+                and aux files are stable.  Intermediate passes use
+                -draftmode.
+            in_place: Compile the sources where they are in proj_fs, which
+                must be on the OS filesystem, instead of copying them.
+                Outputs are written with -output-directory, and with
+                build_dir the returned Pdfs refer to the output files instead
+                of holding their bytes.  Files added with fname are linked
+                instead of copied.
+            format_dir: An optional directory searched for pdflatex format
+                (.fmt) files, e.g. `FormatCache.cache_dir`, so formats are
+                loaded from where they are without copying them.
+        '''
         if proj_fs is None:
             proj_fs = fs.memoryfs.MemoryFS()
+        if cache is not None and build_dir is not None:
+            raise ValueError('cache and build_dir cannot be combined')
+        if in_place and not proj_fs.hassyspath('/'):
+            raise ValueError('in_place requires proj_fs to be on the OS '
+                             'filesystem')
         self.proj_fs = proj_fs
         self.file_map = {}
+        self.cache = cache
+        self.build_dir = build_dir
+        self.max_passes = max_passes
+        self.in_place = in_place
+        self.format_dir = format_dir
+        self._dirty = set()  # Paths written since their digest was computed
+        self._digests = {}
 
     def add_file(self, path_or_obj, text=None, data=None, file=None,
-                 fname=None):
+                 fname=None, replace=False, link=None):
+        '''
+        Adds a file to the project from exactly one of a FileAbc object, text,
+        bytes data, an open file, or a file name.
+
+        If replace is true, a different file already at the same path (and
+        any of its required files) is replaced instead of raising an error.
+        If link is true (the default for in_place projects), a file given by
+        fname, or a file object read lazily from a file name, is hard-linked
+        or symlinked into proj_fs when possible instead of copied.
+        '''
         if isinstance(path_or_obj, FileAbc):
             obj = path_or_obj
             path = obj.path
@@ -32,15 +95,21 @@ class LatexProject:
                 + (fname is not None)) != 1:
             raise TypeError(
                     'Specify exactly one of text, data, file, or fname.')
-        if path in self.file_map:
+        if path in self.file_map and not replace:
             if obj == self.file_map[path]:
                 # obj has already been added
                 return
             else:
                 raise RuntimeError(f'Two files with the same path: {path}')
-        if fname is not None:
+        self._dirty.add(fs.path.abspath(path))
+        if link is None:
+            link = self.in_place
+        if fname is not None and link and self.proj_fs.hassyspath('/'):
+            self.file_map[path] = None
+            self._link_file(fname, path)
+        elif fname is not None:
             with open(fname, 'rb') as f:
-                self.add_file(path, file=f)
+                self.add_file(path, file=f, replace=replace)
         elif file is not None:
             self.file_map[path] = None
             self.proj_fs.makedir(fs.path.dirname(path), recreate=True)
@@ -56,8 +125,17 @@ class LatexProject:
         else:
             self.file_map[path] = obj
             for sub in obj.get_required_files():
-                self.add_file(sub)
+                self.add_file(sub, replace=replace)
             self.proj_fs.makedir(fs.path.dirname(path), recreate=True)
+            src_fname = getattr(obj, 'fname', None)
+            if src_fname is not None and self.proj_fs.hassyspath(path):
+                dst = self.proj_fs.getsyspath(path)
+                if os.path.exists(dst) and os.path.samefile(src_fname, dst):
+                    # Already in place, e.g. an output of an earlier step
+                    return
+                if link:
+                    self._link_file(src_fname, path)
+                    return
             if obj.is_text():
                 with self.proj_fs.open(path, 'w') as f:
                     obj.write_content(f)
@@ -65,6 +143,20 @@ class LatexProject:
                 with self.proj_fs.open(path, 'wb') as f:
                     obj.write_content(f)
 
+    def _link_file(self, fname, path):
+        self.proj_fs.makedir(fs.path.dirname(path), recreate=True)
+        dst = self.proj_fs.getsyspath(path)
+        src = os.path.abspath(fname)
+        if os.path.lexists(dst):
+            if os.path.exists(dst) and os.path.samefile(src, dst):
+                return
+            os.remove(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            # E.g. a different device or a filesystem without hard links
+            os.symlink(src, dst)
+
     @staticmethod
     def _get_fs(base_dir=None, dst_fs=None):
         if (base_dir is not None) + (dst_fs is not None) < 1:
@@ -97,62 +189,343 @@ class LatexProject:
                                       **pdf_args)[0]
 
     def compile_pdf_batch(self, fname_list, tmp_dir=None,
-                          return_path=False, options=None, **pdf_args):
+                          return_path=False, options=None, max_workers=None,
+                          **pdf_args):
+        '''
+        Compiles each top-level file in fname_list.
+
+        Args:
+            max_workers: If greater than one, compile up to this many files
+                concurrently.  Outputs are still returned in input order.
+        '''
+        if tmp_dir is None and self.build_dir is not None:
+            return self._compile_pdf_batch_incremental(
+                                fname_list, return_path, options,
+                                max_workers, pdf_args)
+        if tmp_dir is None and self.cache is not None and not return_path:
+            return self._compile_pdf_batch_cached(fname_list, options,
+                                                  max_workers, pdf_args)
         if tmp_dir is None:
             with tempfile.TemporaryDirectory() as tmp_dir:
                 return self.compile_pdf_batch(
                                 fname_list, tmp_dir=tmp_dir,
                                 return_path=return_path,
                                 options=options,
+                                max_workers=max_workers,
                                 **pdf_args)
-        tmp_fs = fs.open_fs(tmp_dir, writeable=False)
-        self.write_src(tmp_dir)
+        if self.in_place:
+            src_dir = self._make_output_dirs(tmp_dir)
+        else:
+            self.write_src(tmp_dir)
+            src_dir = tmp_dir
+        return self._compile_in_dir(fname_list, src_dir, tmp_dir,
+                                    return_path, options, max_workers,
+                                    pdf_args)
+
+    def _make_output_dirs(self, out_dir):
+        '''
+        Mirrors the project directories in out_dir for -output-directory and
+        returns the project's source directory.
+        '''
+        for path in self.proj_fs.walk.dirs():
+            os.makedirs(os.path.join(out_dir, path.lstrip('/')),
+                        exist_ok=True)
+        return self.proj_fs.getsyspath('/')
+
+    def _compile_in_dir(self, fname_list, src_dir, out_dir, return_path,
+                        options, max_workers, pdf_args, as_path=False):
+        out_fs = fs.open_fs(out_dir, writeable=False)
+
+        def compile_one(fname):
+            return self._compile_file(fname, src_dir, out_dir, out_fs,
+                                      return_path=return_path,
+                                      options=options, pdf_args=pdf_args,
+                                      as_path=as_path)
+        if max_workers is None or max_workers <= 1 or len(fname_list) <= 1:
+            return [compile_one(fname) for fname in fname_list]
+        # Never run two jobs for the same file at once
+        unique_list = list(dict.fromkeys(fname_list))
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            out_map = dict(zip(unique_list,
+                               executor.map(compile_one, unique_list)))
+        return [out_map[fname] for fname in fname_list]
+
+    @staticmethod
+    def _job_paths(fname, src_dir, out_dir):
+        fpath = fs.path.join(src_dir, fname)
+        # Keep outputs and aux files beside each source so jobs in different
+        # directories never collide
+        sub_dir = fs.path.dirname(fname).lstrip('/')
+        output_dir = fs.path.join(out_dir, sub_dir)
+        if output_dir.rstrip('/') == src_dir.rstrip('/'):
+            output_dir = None
+        return fpath, output_dir
+
+    def _compile_file(self, fname, src_dir, out_dir, out_fs,
+                      return_path=False, options=None, pdf_args=None,
+                      as_path=False):
+        fpath, output_dir = self._job_paths(fname, src_dir, out_dir)
+        self.run_pdflatex_until_stable(
+                fpath, cwd=src_dir,
+                options=PDFLATEX_OPTIONS if options is None else options,
+                output_dir=output_dir, max_passes=self.max_passes)
+        return self._read_output(fname, out_fs, return_path=return_path,
+                                 pdf_args=pdf_args, as_path=as_path)
+
+    def _read_output(self, fname, tmp_fs, return_path=False, pdf_args=None,
+                     as_path=False):
+        out_fname = self._get_output_fname(fname, 'pdf')
+        data = None
+        if tmp_fs.exists(out_fname):
+            if not return_path and not as_path:
+                data = tmp_fs.readbytes(out_fname)
+        else:
+            out_fname = None
+        if return_path:
+            return out_fname
+        log_fname = self._get_output_fname(fname, 'log')
+        if tmp_fs.exists(log_fname):
+            log = tmp_fs.readtext(log_fname)
+        else:
+            log = None
+        if as_path and out_fname is not None:
+            return Pdf(fname=tmp_fs.getsyspath(out_fname), log=log,
+                       **(pdf_args or {}))
+        return Pdf(data=data, log=log, **(pdf_args or {}))
+
+    def _source_digests(self):
+        '''
+        Returns a dict mapping each project path to a digest of its contents.
+
+        Files are only read again if they were added since the last call or
+        their size or modification time changed, e.g. by an edit on disk or
+        a write through proj_fs.
+        '''
+        paths = sorted(self.proj_fs.walk.files())
+        if self.in_place:
+            # Avoid reading large assets that are compiled in place
+            return {path: '{}-{}'.format(*self._stat_key(path))
+                    for path in paths}
+        for path in paths:
+            stat_key = self._stat_key(path)
+            cached = self._digests.get(path)
+            if (path in self._dirty or cached is None
+                    or cached[0] != stat_key):
+                h = hashlib.sha256()
+                with self.proj_fs.open(path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(2**16), b''):
+                        h.update(chunk)
+                self._digests[path] = stat_key, h.hexdigest()
+        self._dirty.clear()
+        return {path: self._digests[path][1] for path in paths}
+
+    def _stat_key(self, path):
+        if self.proj_fs.hassyspath(path):
+            st = os.stat(self.proj_fs.getsyspath(path))
+            return st.st_size, st.st_mtime_ns
+        details = self.proj_fs.getinfo(path, namespaces=['details']).raw.get(
+                'details', {})
+        return details.get('size'), details.get('modified')
+
+    def _load_build_state(self, build_fs):
+        try:
+            state = json.loads(build_fs.readtext(self.BUILD_STATE_FNAME))
+        except (fs.errors.ResourceNotFound, ValueError):
+            state = {}
+        state.setdefault('files', {})
+        state.setdefault('outputs', {})
+        return state
+
+    def _sync_build_dir(self, build_fs, state, digests):
+        '''
+        Writes only the project files that differ from the last build and
+        deletes files that were removed from the project.
+        '''
+        for path in list(state['files']):
+            if path not in digests:
+                if build_fs.isfile(path):
+                    build_fs.remove(path)
+                del state['files'][path]
+        for path, digest in digests.items():
+            if state['files'].get(path) == digest and build_fs.exists(path):
+                continue
+            build_fs.makedir(fs.path.dirname(path), recreate=True)
+            fs.copy.copy_file(self.proj_fs, path, build_fs, path)
+            state['files'][path] = digest
+
+    def _compile_pdf_batch_incremental(self, fname_list, return_path,
+                                       options, max_workers, pdf_args):
+        os.makedirs(self.build_dir, exist_ok=True)
+        build_fs = fs.open_fs(self.build_dir, writeable=True)
+        state = self._load_build_state(build_fs)
+        digests = self._source_digests()
+        if self.in_place:
+            src_dir = self._make_output_dirs(self.build_dir)
+        else:
+            self._sync_build_dir(build_fs, state, digests)
+            src_dir = self.build_dir
+        src_digest = cache_module.RenderCache.make_key(
+                        *(f'{path}\0{digest}'
+                          for path, digest in digests.items()))
+        options_str = None if options is None else '\0'.join(options)
+        build_keys = {fname: cache_module.RenderCache.make_key(
+                                src_digest, fname, options_str,
+                                str(self.max_passes))
+                      for fname in fname_list}
+        stale_list = [fname for fname in dict.fromkeys(fname_list)
+                      if state['outputs'].get(fname) != build_keys[fname]
+                         or not build_fs.exists(
+                                self._get_output_fname(fname, 'pdf'))]
+        try:
+            self._compile_in_dir(stale_list, src_dir, self.build_dir, True,
+                                 options, max_workers, pdf_args)
+        finally:
+            # Record files written even if compiling failed
+            build_fs.writetext(self.BUILD_STATE_FNAME, json.dumps(state))
+        for fname in stale_list:
+            state['outputs'][fname] = build_keys[fname]
+        build_fs.writetext(self.BUILD_STATE_FNAME, json.dumps(state))
+        return [self._read_output(fname, build_fs, return_path=return_path,
+                                  pdf_args=pdf_args, as_path=self.in_place)
+                for fname in fname_list]
+
+    def _cache_key(self, src_digest, fname, options):
+        options_str = None if options is None else '\0'.join(options)
+        return self.cache.make_key(src_digest, fname, options_str,
+                                   str(self.max_passes),
+                                   cache_module.pdflatex_version())
+
+    def _cache_lookup(self, fname_list, options, pdf_args):
+        '''
+        Returns the cache keys, a list of cached Pdfs with None for each miss,
+        and the indices of the misses.
+        '''
+        src_digest = cache_module.fs_digest(self.proj_fs)
+        keys = [self._cache_key(src_digest, fname, options)
+                for fname in fname_list]
         out_list = []
-        for fname in fname_list:
-            fpath = fs.path.join(tmp_dir, fname)
-            if options is None:
-                self.run_pdflatex(fpath, cwd=tmp_dir)
-            else:
-                self.run_pdflatex(fpath, cwd=tmp_dir, options=options)
-            out_fname = self._get_output_fname(fname, 'pdf')
-            data = None
-            if tmp_fs.exists(out_fname):
-                if not return_path:
-                    data = tmp_fs.readbytes(out_fname)
-            else:
-                out_fname = None
-            if return_path:
-                out_list.append(out_fname)
-            else:
-                log_fname = self._get_output_fname(fname, 'log')
-                if tmp_fs.exists(log_fname):
-                    log = tmp_fs.readtext(log_fname)
-                else:
-                    log = None
-                pdf = Pdf(data=data, log=log, **pdf_args)
-                out_list.append(pdf)
+        missing = []
+        for i, key in enumerate(keys):
+            entry = self.cache.get(key)
+            if entry is None or 'output.pdf' not in entry:
+                missing.append(i)
+                out_list.append(None)
+                continue
+            log = entry.get('output.log')
+            if log is not None:
+                log = log.decode()
+            out_list.append(Pdf(data=entry['output.pdf'], log=log,
+                                **pdf_args))
+        return keys, out_list, missing
+
+    def _cache_store(self, keys, out_list, missing, pdfs):
+        for i, pdf in zip(missing, pdfs):
+            out_list[i] = pdf
+            if pdf.data is None:
+                continue
+            entry = {'output.pdf': pdf.data}
+            if pdf.log is not None:
+                entry['output.log'] = pdf.log.encode()
+            self.cache.put(keys[i], entry)
+
+    def _compile_pdf_batch_cached(self, fname_list, options, max_workers,
+                                  pdf_args):
+        keys, out_list, missing = self._cache_lookup(fname_list, options,
+                                                     pdf_args)
+        if missing:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                pdfs = self.compile_pdf_batch(
+                                [fname_list[i] for i in missing],
+                                tmp_dir=tmp_dir, options=options,
+                                max_workers=max_workers, **pdf_args)
+            self._cache_store(keys, out_list, missing, pdfs)
         return out_list
 
+    async def compile_pdf_async(self, fname='main.tex', options=None,
+                                semaphore=None, **pdf_args):
+        '''
+        Coroutine version of compile_pdf.
+
+        Cancelling the task kills the pdflatex process.
+        '''
+        return (await self.compile_pdf_batch_async(
+                            [fname], options=options, semaphore=semaphore,
+                            **pdf_args))[0]
+
+    async def compile_pdf_batch_async(self, fname_list, options=None,
+                                      semaphore=None, **pdf_args):
+        '''
+        Coroutine version of compile_pdf_batch.
+
+        Files are compiled concurrently, limited by semaphore or by the
+        limit set with `latextools.set_async_concurrency`.  The build_dir
+        of the project is not used: each call compiles from scratch in a
+        temporary directory.
+        '''
+        if self.cache is not None:
+            keys, out_list, missing = await asyncio.to_thread(
+                    self._cache_lookup, fname_list, options, pdf_args)
+            if missing:
+                pdfs = await self._compile_pdf_batch_async(
+                                [fname_list[i] for i in missing],
+                                options, semaphore, pdf_args)
+                await asyncio.to_thread(self._cache_store, keys, out_list,
+                                        missing, pdfs)
+            return out_list
+        return await self._compile_pdf_batch_async(fname_list, options,
+                                                   semaphore, pdf_args)
+
+    async def _compile_pdf_batch_async(self, fname_list, options, semaphore,
+                                       pdf_args):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            tmp_fs = fs.open_fs(tmp_dir, writeable=False)
+            if self.in_place:
+                src_dir = await asyncio.to_thread(self._make_output_dirs,
+                                                  tmp_dir)
+            else:
+                await asyncio.to_thread(self.write_src, tmp_dir)
+                src_dir = tmp_dir
+            unique_list = list(dict.fromkeys(fname_list))
+
+            async def compile_one(fname):
+                fpath, output_dir = self._job_paths(fname, src_dir, tmp_dir)
+                await self.run_pdflatex_until_stable_async(
+                        fpath, cwd=src_dir,
+                        options=PDFLATEX_OPTIONS if options is None
+                                else options,
+                        output_dir=output_dir, max_passes=self.max_passes,
+                        semaphore=semaphore)
+                return await asyncio.to_thread(self._read_output, fname,
+                                               tmp_fs, pdf_args=pdf_args)
+            # Every job must stop before the directory is removed
+            pdfs = await async_util.gather_or_cancel(
+                            *map(compile_one, unique_list))
+            out_map = dict(zip(unique_list, pdfs))
+        return [out_map[fname] for fname in fname_list]
+
     def save_pdf(self, fname='main.tex', base_dir=None, dst_fs=None,
                  tmp_dir=None):
         self.save_pdf_batch([fname], base_dir=base_dir, dst_fs=dst_fs,
                             tmp_dir=tmp_dir)
 
     def save_pdf_batch(self, fname_list, base_dir=None, dst_fs=None,
-                       tmp_dir=None):
-        if tmp_dir is None:
+                       tmp_dir=None, max_workers=None):
+        if tmp_dir is None and self.build_dir is None:
             with tempfile.TemporaryDirectory() as tmp_dir:
                 return self.save_pdf_batch(
                             fname_list, base_dir=base_dir,
-                            dst_fs=dst_fs, tmp_dir=tmp_dir)
+                            dst_fs=dst_fs, tmp_dir=tmp_dir,
+                            max_workers=max_workers)
 
         dst_fs = self._get_fs(base_dir, dst_fs)
         base_dir = '/'
-        tmp_fs = fs.open_fs(tmp_dir, writeable=False)
 
         out_fname_list = self.compile_pdf_batch(
                                 fname_list, tmp_dir=tmp_dir,
-                                return_path=True)
+                                return_path=True, max_workers=max_workers)
+        if tmp_dir is None:
+            tmp_dir = self.build_dir
+        tmp_fs = fs.open_fs(tmp_dir, writeable=False)
         for _, fname in zip(fname_list, out_fname_list):
             if fname is None:
                 continue
@@ -163,12 +536,14 @@ class LatexProject:
                 raise LatexError(
                     f'Output file not generated from source file {in_fname}')
 
-    def run_pdflatex(self, fpath, cwd,
-                     options=('-halt-on-error', '-file-line-error',
-                              '-interaction', 'nonstopmode')):
+    def run_pdflatex(self, fpath, cwd, options=PDFLATEX_OPTIONS,
+                     output_dir=None):
+        if output_dir is not None:
+            options = (*options, f'-output-directory={output_dir}')
         try:
             p = subprocess.Popen(['pdflatex', *options, fpath],
                                  cwd=cwd,
+                                 env=self._pdflatex_env(),
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE)
         except FileNotFoundError:
@@ -182,3 +557,123 @@ class LatexProject:
             if stderr:
                 msg += stderr.decode()
             raise LatexError(msg)
+
+    def _pdflatex_env(self):
+        if self.format_dir is None:
+            return None
+        env = dict(os.environ)
+        # A trailing separator keeps the default search path
+        env['TEXFORMATS'] = (os.path.abspath(self.format_dir) + os.pathsep
+                             + env.get('TEXFORMATS', ''))
+        return env
+
+    def run_pdflatex_until_stable(self, fpath, cwd, options=PDFLATEX_OPTIONS,
+                                  output_dir=None, max_passes=5):
+        '''
+        Runs pdflatex until cross-references are resolved, like latexmk.
+
+        A pass is stable when the log asks for no rerun, no aux file that
+        existed before the pass changed, and no missing aux file was read.
+        The first pass writes a PDF so most documents need only one pass.
+        Later passes use -draftmode until stable, then one final pass writes
+        the PDF.
+
+        Returns the number of passes run.
+        '''
+        passes = 0
+        for draft in self._pass_modes(fpath, cwd, output_dir, max_passes):
+            self.run_pdflatex(fpath, cwd,
+                              options=(*options, '-draftmode') if draft
+                                      else options,
+                              output_dir=output_dir)
+            passes += 1
+        return passes
+
+    def _pass_modes(self, fpath, cwd, output_dir, max_passes):
+        '''
+        Yields whether each pdflatex pass should use -draftmode and checks
+        for stability after each pass.
+        '''
+        aux_dir = cwd if output_dir is None else output_dir
+        job = os.path.splitext(os.path.basename(fpath))[0]
+        before = self._aux_digests(aux_dir, job)
+        draft = False
+        for i in range(max_passes):
+            yield draft
+            after = self._aux_digests(aux_dir, job)
+            stable = self._is_stable(before, after, aux_dir, job)
+            before = after
+            if not draft and (stable or i >= max_passes-1):
+                return
+            # Only use draft mode when there is a pass left for the PDF
+            draft = not stable and i < max_passes-2
+
+    @staticmethod
+    def _read_log(aux_dir, job):
+        try:
+            with open(os.path.join(aux_dir, f'{job}.log'), 'r',
+                      errors='replace') as f:
+                return f.read()
+        except FileNotFoundError:
+            return ''
+
+    def _aux_digests(self, aux_dir, job):
+        '''
+        Returns digests of the job's own aux files and of the \\include aux
+        files its log lists.  Other jobs compiling in the same directory do
+        not affect the result.
+        '''
+        names = [f'{job}.{ext}' for ext in self.AUX_EXTENSIONS]
+        names.extend(self._OPENOUT_RE.findall(self._read_log(aux_dir, job)))
+        digests = {}
+        for name in map(os.path.normpath, names):
+            try:
+                with open(os.path.join(aux_dir, name), 'rb') as f:
+                    digests[name] = hashlib.sha256(f.read()).digest()
+            except FileNotFoundError:
+                continue
+        return digests
+
+    _RERUN_RE = re.compile(r'Rerun to get|Label\(s\) may have changed')
+    _UNDEFINED_RE = re.compile(r'There were undefined (references|citations)')
+    _MISSING_RE = re.compile(r'^No file (.+)\.$', re.MULTILINE)
+    _OPENOUT_RE = re.compile(r"^\\openout[0-9]+ = `?(.+?\.aux)'?\.?$",
+                             re.MULTILINE)
+
+    def _is_stable(self, before, after, aux_dir, job):
+        log = self._read_log(aux_dir, job)
+        if self._RERUN_RE.search(log):
+            return False
+        # Another pass only helps undefined references if this pass wrote
+        # new labels, otherwise they are genuinely undefined
+        if self._UNDEFINED_RE.search(log) and after != before:
+            return False
+        if any(after.get(name) != digest for name, digest in before.items()):
+            return False
+        # The main aux file is always missing on the first pass
+        missing = set(self._MISSING_RE.findall(log)) - {f'{job}.aux'}
+        return not any(os.path.normpath(name) in after for name in missing)
+
+    async def run_pdflatex_async(self, fpath, cwd, options=PDFLATEX_OPTIONS,
+                                 output_dir=None, semaphore=None):
+        if output_dir is not None:
+            options = (*options, f'-output-directory={output_dir}')
+        await async_util.run_process(
+                ['pdflatex', *options, fpath], cwd=cwd,
+                not_found_msg='Latex compiler pdflatex not found.',
+                error_type=LatexError, semaphore=semaphore,
+                env=self._pdflatex_env())
+
+    async def run_pdflatex_until_stable_async(self, fpath, cwd,
+                                              options=PDFLATEX_OPTIONS,
+                                              output_dir=None, max_passes=5,
+                                              semaphore=None):
+        '''Coroutine version of `run_pdflatex_until_stable`.'''
+        passes = 0
+        for draft in self._pass_modes(fpath, cwd, output_dir, max_passes):
+            await self.run_pdflatex_async(
+                    fpath, cwd,
+                    options=(*options, '-draftmode') if draft else options,
+                    output_dir=output_dir, semaphore=semaphore)
+            passes += 1
+        return passes
@@ -0,0 +1,62 @@
+from . import package, command
+
+
+def resolve_requirements(roots):
+    '''
+    Returns the sorted lists of packages and commands required by roots.
+
+    The graph of content, packages, and commands is walked once without
+    recursion and shared dependencies are only visited once.  Packages that
+    cannot coexist are merged when `LatexPackage.can_merge` allows it (e.g.
+    the same package with different options).  Sorting by require depth
+    places each package or command after its dependencies.
+
+    Args:
+        roots: Content, packages, and commands.
+    '''
+    packages = {}
+    commands = {}
+    seen_content = set()
+    stack = list(roots)
+    root_ids = set(map(id, stack))
+    while stack:
+        node = stack.pop()
+        if isinstance(node, package.LatexPackage):
+            if node in packages:
+                continue
+            packages[node] = None
+        elif isinstance(node, command.LatexCommand):
+            if node in commands:
+                continue
+            commands[node] = None
+        else:
+            # Content is mutable so compare by identity
+            if id(node) in seen_content:
+                continue
+            seen_content.add(id(node))
+            cached = getattr(node, '_requirements_cache', None)
+            if cached is not None and id(node) not in root_ids:
+                # Already resolved for this sub content
+                stack.extend(cached[0])
+                stack.extend(cached[1])
+                continue
+            stack.extend(node.list_sub_content())
+        stack.extend(node.packages)
+        stack.extend(node.commands)
+        if getattr(node, 'setup_content', None) is not None:
+            stack.append(node.setup_content)
+    return _merge_packages(sorted(packages)), sorted(commands)
+
+def _merge_packages(packages):
+    out = []
+    by_name = {}  # Name -> indices in out
+    for p in packages:
+        for i in by_name.get(p.name, ()):
+            other = out[i]
+            if not other.can_coexist(p) and other.can_merge(p):
+                out[i] = other.merge_packages(p)
+                break
+        else:
+            by_name.setdefault(p.name, []).append(len(out))
+            out.append(p)
+    return out
@@ -1,25 +1,78 @@
+import asyncio
+import functools
 import os
+import re
 import subprocess
 import fs.tempfs
 
-from .project import LatexProject
+from .project import LatexProject, LatexError
+from .pdf import Pdf
 from .content import BasicContent
 from .document import DocumentConfig, STANDALONE_CONFIG
 from .command import LatexCommand
 from .file import PlainTextFile, BinaryFile
 from .common_preamble import pkg
+from .convert import split_pdf_pages
+from .inkscape_pool import get_inkscape_pool, inkscape_actions
+
+
+SNIPPET_OPTIONS = ('-halt-on-error', '-file-line-error', '-interaction',
+                   'nonstopmode', '-shell-escape')
+
+
+class LatexSnippetError(LatexError):
+    def __init__(self, msg, index):
+        super().__init__(msg)
+        self.index = index
 
 
 def render_snippet(content=r'$Z\cdot Y=X$', *packages, commands=(),
                    lpad=0, rpad=0, tpad=0, bpad=0, pad=None,
-                   config=STANDALONE_CONFIG):
+                   config=STANDALONE_CONFIG, cache=None, fmt_cache=None,
+                   pool=None):
     '''Easy way to render a small snippet of Latex code.
 
     Use `latextools.pkg` and `.cmd` for quick package and command definitions.
+    Pass a `latextools.RenderCache` as `cache` to reuse previous renders of
+    identical snippets and a `latextools.FormatCache` as `fmt_cache` to load
+    the preamble from a precompiled format.  Pass a `latextools.PdflatexPool`
+    as `pool` to compile with a warm worker process instead (`cache` is then
+    not used).
 
     Returns a Pdf object.  Save with `obj.save('file.pdf')`.  Add to drawing
     with `d.draw(obj)` (using drawsvg).
     '''
+    doc = _snippet_document(content, packages, commands, lpad, rpad, tpad,
+                            bpad, pad, config)
+    if pool is not None:
+        return pool.render(doc)
+    proj = doc.as_project(cache=cache, fmt_cache=fmt_cache)
+    r = proj.compile_pdf(options=SNIPPET_OPTIONS)
+    return r
+
+async def render_snippet_async(content=r'$Z\cdot Y=X$', *packages,
+                               commands=(), lpad=0, rpad=0, tpad=0, bpad=0,
+                               pad=None, config=STANDALONE_CONFIG, cache=None,
+                               fmt_cache=None, semaphore=None):
+    '''Coroutine version of `render_snippet`.
+
+    Cancelling the task kills the pdflatex process.
+    '''
+    doc = _snippet_document(content, packages, commands, lpad, rpad, tpad,
+                            bpad, pad, config)
+    if fmt_cache is None:
+        proj = doc.as_project(cache=cache)
+    else:
+        # Building a missing format file blocks
+        loop = asyncio.get_running_loop()
+        proj = await loop.run_in_executor(
+                None, functools.partial(doc.as_project, cache=cache,
+                                        fmt_cache=fmt_cache))
+    return await proj.compile_pdf_async(options=SNIPPET_OPTIONS,
+                                        semaphore=semaphore)
+
+def _snippet_document(content, packages, commands, lpad, rpad, tpad, bpad,
+                      pad, config):
     if pad is not None:
         lpad, bpad, rpad, tpad = (pad,) * 4
     if config is None:
@@ -34,18 +87,88 @@ def render_snippet(content=r'$Z\cdot Y=X$', *packages, commands=(),
             config = DocumentConfig(
                 'standalone', options=(*config.options, border_conf),
                 packages=config.packages, commands=config.commands)
-    proj = LatexProject()
     content = BasicContent(content, packages, commands)
-    proj.add_file(content.as_document(path='main.tex', config=config))
-    r = proj.compile_pdf(options=['-halt-on-error', '-file-line-error',
-                                  '-interaction', 'nonstopmode',
-                                  '-shell-escape'])
-    return r
+    return content.as_document(path='main.tex', config=config)
+
+def render_snippets(contents, *packages, commands=(),
+                    lpad=0, rpad=0, tpad=0, bpad=0, pad=None,
+                    config=STANDALONE_CONFIG, cache=None, fmt_cache=None,
+                    recompile_rest=False):
+    '''Renders many snippets of Latex code with a single pdflatex run.
+
+    All snippets share the same packages and commands and are compiled as the
+    pages of one standalone document, which is then split into one Pdf per
+    snippet.  Identical snippets are only compiled once.  Requires the
+    pdfseparate command line tool.
+
+    If a snippet fails to compile, LatexSnippetError is raised with the index
+    of the failing snippet.  With `recompile_rest=True`, the failing snippet
+    instead gets a Pdf with no data and the error as its log, and the other
+    snippets are compiled again without it.
+
+    Returns a list of Pdf objects in the order of `contents`.
+    '''
+    unique = list(dict.fromkeys(contents))
+    first_index = {}
+    for i, content in enumerate(contents):
+        first_index.setdefault(content, i)
+    remaining = list(range(len(unique)))
+    results = {}
+    while remaining:
+        proj = _snippets_project([unique[i] for i in remaining], packages,
+                                 commands, lpad, rpad, tpad, bpad, pad,
+                                 config, cache, fmt_cache)
+        try:
+            pdf = proj.compile_pdf(options=SNIPPET_OPTIONS)
+        except LatexError as e:
+            m = _SNIPPET_ERROR_RE.search(str(e))
+            if m is None:
+                # The error is not inside any snippet
+                raise
+            failed = remaining.pop(int(m.group(1)))
+            if not recompile_rest:
+                raise LatexSnippetError(str(e),
+                                        first_index[unique[failed]]) from e
+            results[failed] = Pdf(log=str(e))
+            continue
+        pages = split_pdf_pages(pdf)
+        if len(pages) != len(remaining):
+            raise LatexError(f'Expected {len(remaining)} pages but got '
+                             f'{len(pages)}.  Each snippet must produce '
+                             f'exactly one page.')
+        for i, page in zip(remaining, pages):
+            page.log = pdf.log
+            results[i] = page
+        break
+    unique_index = {content: i for i, content in enumerate(unique)}
+    return [results[unique_index[content]] for content in contents]
+
+_SNIPPET_ERROR_RE = re.compile(r'snippets/snippet-([0-9]+)\.tex:[0-9]+:')
+_SNIPPET_ENV = LatexCommand('ltxsnippet',
+                            r'\newenvironment{ltxsnippet}{}{}')
+
+def _snippets_project(contents, packages, commands, lpad, rpad, tpad, bpad,
+                      pad, config, cache, fmt_cache):
+    body = '\n'.join(r'\begin{ltxsnippet}\input{snippets/snippet-'
+                     f'{i}}}\\end{{ltxsnippet}}%'
+                     for i in range(len(contents)))
+    doc = _snippet_document(body, packages, (*commands, _SNIPPET_ENV),
+                            lpad, rpad, tpad, bpad, pad, config)
+    if doc.config.doc_type == 'standalone':
+        # One page per snippet environment
+        doc.config = DocumentConfig(
+            'standalone', options=(*doc.config.options, 'multi=ltxsnippet'),
+            packages=doc.config.packages, commands=doc.config.commands)
+    proj = doc.as_project(cache=cache, fmt_cache=fmt_cache)
+    for i, content in enumerate(contents):
+        proj.add_file(f'snippets/snippet-{i}.tex', text=content.strip()+'\n')
+    return proj
 
 def render_qcircuit(content=r'& \gate{X} & \qw', *packages, r=0.5, c=0.7,
                     const_size=False, const_row=False, const_col=False,
                     lpad=1, rpad=1, tpad=1, bpad=1, pad=None,
-                    commands=(), config=None):
+                    commands=(), config=None, cache=None, fmt_cache=None,
+                    pool=None):
     '''Easy way to render a qcircuit diagram.
 
     Use `latextools.pkg` and `.cmd` for quick package and command definitions.
@@ -67,7 +190,8 @@ def render_qcircuit(content=r'& \gate{X} & \qw', *packages, r=0.5, c=0.7,
     content = '\\Qcircuit {} {{\n{}\n}}'.format(q_conf, content.strip())
     return render_snippet(content,
         pkg.qcircuit, *packages, lpad=lpad, rpad=rpad, tpad=tpad, bpad=bpad,
-        pad=pad, commands=commands, config=config)
+        pad=pad, commands=commands, config=config, cache=cache,
+        fmt_cache=fmt_cache, pool=pool)
 
 _SAMPLE_SVG = r'''<svg width="50" height="50" viewBox="0 -50 50 50">
 <circle cx="25" cy="-25" r="25" />
@@ -148,9 +272,23 @@ def render_svg_intermediate(text_fname_or_drawing=_SAMPLE_SVG,
     else:
         svg_fname = fname
     render_path = os.path.join(out_dir, f'{out_base.replace(".", "_")}-tex.pdf')
-    ret = subprocess.call([
-            inkscape, *inkscape_args, f'--export-filename={render_path}',
-            svg_fname])
+    pool = get_inkscape_pool()
+    actions = inkscape_actions(inkscape_args)
+    ret = None
+    if pool is not None and actions is not None:
+        try:
+            pool.export(svg_fname, render_path, actions, inkscape=inkscape)
+            ret = 0
+        except ValueError:
+            # The path can't be used in shell mode
+            pass
+        except LatexError as e:
+            raise RuntimeError(f'Inkscape failed to convert svg to PDF+LaTeX.'
+                               f'\n{e}') from e
+    if ret is None:
+        ret = subprocess.call([
+                inkscape, *inkscape_args, f'--export-filename={render_path}',
+                svg_fname])
     if ret != 0:
         raise RuntimeError(f'Inkscape failed to convert svg to PDF+LaTeX.  '
                 f'Inkscape version 1.1 must be installed and the `{inkscape}` '
@@ -4,3 +4,54 @@ def prefix_lines(prefix, text, clean=True):
     if clean:
         prefixed_lines = map(str.rstrip, prefixed_lines)
     return '\n'.join(prefixed_lines)
+
+
+class LatexWriter:
+    def __init__(self, f):
+        '''
+        Writes text to a file while holding back trailing whitespace and
+        separators until more text follows.
+
+        Held back text written after a mark can be dropped to match
+        `str.rstrip` and `filter(bool)` on the equivalent string.
+        '''
+        self.f = f
+        self._pending = []
+        self._count = 0  # Number of non-whitespace writes
+
+    @classmethod
+    def wrap(cls, f):
+        return f if isinstance(f, cls) else cls(f)
+
+    def write(self, text):
+        head = text.rstrip()
+        if head:
+            if self._pending:
+                self.f.write(''.join(self._pending))
+                self._pending.clear()
+            self.f.write(head)
+            self._count += 1
+        tail = text[len(head):]
+        if tail:
+            self._pending.append(tail)
+
+    def write_separator(self, sep):
+        '''Writes sep only if non-whitespace text follows.'''
+        self._pending.append(sep)
+
+    def mark(self):
+        return self._count, len(self._pending)
+
+    def is_empty_since(self, mark):
+        return self._count == mark[0]
+
+    def rstrip_since(self, mark):
+        '''Drops held back text written after mark.'''
+        if self._count == mark[0]:
+            del self._pending[mark[1]:]
+        else:
+            self._pending.clear()
+
+    def flush(self):
+        self.f.write(''.join(self._pending))
+        self._pending.clear()